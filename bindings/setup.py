@@ -4,7 +4,9 @@ extension_module = Extension('_solver',
       include_dirs = ['./include/armanpy/', 'src/'],
       libraries = ['m', 'z', 'armadillo'],
       sources = ['solver.i', 'src/solver.cpp'],
-      swig_opts = ["-c++", "-Wall", "-I./include/armanpy/", "-I./src/",])
+      extra_compile_args = ['-fopenmp'],
+      extra_link_args = ['-fopenmp'],
+      swig_opts = ["-c++", "-Wall", "-threads", "-I./include/armanpy/", "-I./src/",])
 
 setup(name = 'solver',
       py_modules = ['solver'],
@@ -32,4 +32,62 @@ namespace std {
 
 %include "armanpy.i"
 
+%ignore Solver::r_padded;
+%ignore Solver::i_padded;
+
+%pythonappend Solver::Solver %{
+        if len(args) == 10 and args[9]:
+            self._buffers = args[1:3]
+%}
+
 %include "solver.h"
+
+%extend Solver {
+  /*
+   * Wraps the interior of a padded part in a NumPy array, without copy. The
+   * array keeps a reference to owner, the Python solver, so the memory of the
+   * part outlives the array.
+   */
+  PyObject *_view(PyObject *owner, int part, bool writable)
+  {
+    arma::Mat<T> &buffer = (part == 0) ? $self->r_padded() : $self->i_padded();
+
+    npy_intp dims[2] = { npy_intp(buffer.n_rows - 2),
+                         npy_intp(buffer.n_cols - 2) };
+    npy_intp strides[2] = { npy_intp(sizeof(T)),
+                            npy_intp(sizeof(T) * buffer.n_rows) };
+
+    PyObject *array = PyArray_New(&PyArray_Type, 2, dims, NumpyType<T>::val,
+                                  strides, buffer.memptr() + buffer.n_rows + 1,
+                                  0, writable ? NPY_ARRAY_WRITEABLE : 0, NULL);
+
+    if (array == NULL)
+      return NULL;
+
+    Py_INCREF(owner);
+
+    if (PyArray_SetBaseObject((PyArrayObject *) array, owner) < 0) {
+      Py_DECREF(array);
+      return NULL;
+    }
+
+    return array;
+  }
+
+  %pythoncode %{
+    def r_view(self, writable=False):
+        """Returns a view of the real part, read-only unless writable.
+
+        The view shares the memory of the solver and follows compute()."""
+        return self._view(self, 0, writable)
+
+    def i_view(self, writable=False):
+        """Returns a view of the imaginary part, read-only unless writable.
+
+        The view shares the memory of the solver and follows compute()."""
+        return self._view(self, 1, writable)
+  %}
+}
+
+%template(Solver) Solver<double>;
+%template(Solver32) Solver<float>;
@@ -3,6 +3,62 @@
  */
 #include "solver.h"
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+/**
+ * Number of rows solved together by a thread during an ADI y-sweep.
+ */
+static const arma::uword ADI_BLOCK = 64;
+
+/**
+ * Number of columns of a FTCS tile.
+ */
+static const arma::uword FTCS_COLS = 16;
+
+/**
+ * Number of rows of a FTCS tile.
+ */
+static const arma::uword FTCS_ROWS = 256;
+
+/**
+ * \brief      Multiplies two complex numbers.
+ *
+ * Computes a * b without the NaN and infinity checks of std::complex
+ * multiplication.
+ *
+ * \param[in]  a     The first factor
+ * \param[in]  b     The second factor
+ *
+ * \return     The product.
+ */
+template <typename T>
+static inline std::complex<T> mul(const std::complex<T> &a,
+                                  const std::complex<T> &b)
+{
+    return std::complex<T>(a.real() * b.real() - a.imag() * b.imag(),
+                           a.real() * b.imag() + a.imag() * b.real());
+}
+
+/**
+ * \brief      Subtracts a complex product.
+ *
+ * Computes a -= b * c without the NaN and infinity checks of std::complex
+ * multiplication, which prevent the band loops to be vectorized.
+ *
+ * \param      a     The updated value
+ * \param[in]  b     The first factor
+ * \param[in]  c     The second factor
+ */
+template <typename T>
+static inline void sub_mul(std::complex<T> &a, const std::complex<T> &b,
+                           const std::complex<T> &c)
+{
+    a = std::complex<T>(a.real() - (b.real() * c.real() - b.imag() * c.imag()),
+                        a.imag() - (b.real() * c.imag() + b.imag() * c.real()));
+}
+
 /**
  * \brief      Solevr constructor.
  *
@@ -17,9 +73,11 @@
  * \param[in]  _dy     The y speed
  * \param[in]  _dt     The delta time
  */
-Solver::Solver(arma::mat &_V0, arma::mat &_rpart, arma::mat &_ipart,
-               std::string scheme, double _dx, double _dy, double _dt):
-    scheme(scheme), dx(_dx), dy(_dy), dt(_dt)
+template <typename T>
+Solver<T>::Solver(arma::Mat<T> &_V0, arma::Mat<T> &_rpart,
+                  arma::Mat<T> &_ipart, std::string scheme,
+                  double _dx, double _dy, double _dt):
+    scheme(scheme), dx(_dx), dy(_dy), dt(_dt), n_threads(0)
 {
     h_bar = 1.0;
     m     = 1.0;
@@ -27,6 +85,8 @@ Solver::Solver(arma::mat &_V0, arma::mat &_rpart, arma::mat &_ipart,
     V0    = padded(_V0);
     rpart = padded(_rpart);
     ipart = padded(_ipart);
+
+    init();
 }
 
 /**
@@ -42,33 +102,86 @@ Solver::Solver(arma::mat &_V0, arma::mat &_rpart, arma::mat &_ipart,
  * \param[in]  _dy     The y speed
  * \param[in]  _dt     The delta time
  */
-Solver::Solver(arma::mat &_V0, arma::mat &_rpart, arma::mat &_ipart,
-               double _h_bar, double _m, std::string scheme,
-               double _dx, double _dy, double _dt):
-    scheme(scheme), h_bar(_h_bar), m(_m), dx(_dx), dy(_dy), dt(_dt)
+template <typename T>
+Solver<T>::Solver(arma::Mat<T> &_V0, arma::Mat<T> &_rpart,
+                  arma::Mat<T> &_ipart, double _h_bar, double _m,
+                  std::string scheme, double _dx, double _dy, double _dt):
+    scheme(scheme), h_bar(_h_bar), m(_m), dx(_dx), dy(_dy), dt(_dt),
+    n_threads(0)
 {
     V0    = padded(_V0);
     rpart = padded(_rpart);
     ipart = padded(_ipart);
+
+    init();
 }
 
 /**
- * \brief      Compute the next psi value.
+ * \brief      Solver constructor.
  *
- * Calls the right function depending on the scheme to compute the next value of
- * psi.
+ * The potentiel field and the parts are already padded, as returned by
+ * r_padded() and i_padded(). If \p adopt is true, then the memory of the parts
+ * becomes the storage of the solver: nothing is copied, the parts are updated
+ * in place by compute() and must outlive the solver. Otherwise, they are
+ * copied.
+ *
+ * \param      _V0     The padded potentiel field
+ * \param      _rpart  The padded real part
+ * \param      _ipart  The padded imaginary part
+ * \param[in]  _h_bar  The Planck constant
+ * \param[in]  _m      The particle masse
+ * \param[in]  scheme  The scheme
+ * \param[in]  _dx     The x speed
+ * \param[in]  _dy     The y speed
+ * \param[in]  _dt     The delta time
+ * \param[in]  adopt   Whether the parts become the storage of the solver
+ */
+template <typename T>
+Solver<T>::Solver(arma::Mat<T> &_V0, arma::Mat<T> &_rpart,
+                  arma::Mat<T> &_ipart, double _h_bar, double _m,
+                  std::string scheme, double _dx, double _dy, double _dt,
+                  bool adopt):
+    V0(_V0),
+    rpart(_rpart.memptr(), _rpart.n_rows, _rpart.n_cols, !adopt, adopt),
+    ipart(_ipart.memptr(), _ipart.n_rows, _ipart.n_cols, !adopt, adopt),
+    scheme(scheme), h_bar(_h_bar), m(_m), dx(_dx), dy(_dy), dt(_dt),
+    n_threads(0)
+{
+    if (arma::size(rpart) != arma::size(V0) ||
+        arma::size(ipart) != arma::size(V0) ||
+        V0.n_rows < 3 || V0.n_cols < 3)
+        throw std::runtime_error("The padded parts and potentiel field must "
+                                 "have the same size");
+
+    init();
+}
+
+/**
+ * \brief      Compute the next psi values.
+ *
+ * Calls the right function depending on the scheme to compute the next \p n
+ * values of psi.
+ *
+ * \param[in]  n     The number of time steps
  */
-void Solver::compute(void)
+template <typename T>
+void Solver<T>::compute(unsigned int n)
 {
-    switch (scheme.front()) {
-    case 'f':
-        ftcs();
+    switch (method) {
+    case FTCS:
+        ftcs(n);
+        break;
+    case BTCS:
+        btcs(n);
         break;
-    case 'b':
-        btcs();
+    case CTCS:
+        ctcs(n);
         break;
-    case 'c':
-        ctcs();
+    case ADI:
+        adi(n);
+        break;
+    case FFT:
+        fft(n);
         break;
     default:
         break;
@@ -80,7 +193,8 @@ void Solver::compute(void)
  *
  * \return     The current real part.
  */
-arma::mat Solver::r_part(void)
+template <typename T>
+arma::Mat<T> Solver<T>::r_part(void)
 {
     return rpart.submat(1, 1, rpart.n_rows - 2, rpart.n_cols - 2);
 }
@@ -90,11 +204,168 @@ arma::mat Solver::r_part(void)
  *
  * \return     The current imaginary part.
  */
-arma::mat Solver::i_part(void)
+template <typename T>
+arma::Mat<T> Solver<T>::i_part(void)
 {
     return ipart.submat(1, 1, ipart.n_rows - 2, ipart.n_cols - 2);
 }
 
+/**
+ * \brief      Returns the padded real part.
+ *
+ * \return     The storage of the real part, its memory never moves.
+ */
+template <typename T>
+arma::Mat<T> &Solver<T>::r_padded(void)
+{
+    return rpart;
+}
+
+/**
+ * \brief      Returns the padded imaginary part.
+ *
+ * \return     The storage of the imaginary part, its memory never moves.
+ */
+template <typename T>
+arma::Mat<T> &Solver<T>::i_padded(void)
+{
+    return ipart;
+}
+
+/**
+ * \brief      Computes the observables of psi.
+ *
+ * Computes in a single pass over the current buffers, without copying psi:
+ *
+ * - norm: the norm of psi, sqrt(sum |psi|^2);
+ * - x, y: the mean position <x> and <y>;
+ * - energy: the mean energy <H>, with the 5-point Laplacian of the schemes;
+ * - flux_x, flux_y: the mean probability current h_bar / m Im(psi* grad psi),
+ *   i.e. d<x>/dt and d<y>/dt.
+ *
+ * The means are divided by sum |psi|^2, and the sums are accumulated in double
+ * precision whatever the precision of the solver. Rows go along x and columns
+ * along y.
+ *
+ * \param[in]  x_min  The x coordinate of the first row
+ * \param[in]  y_min  The y coordinate of the first column
+ *
+ * \return     The observables, by name.
+ */
+template <typename T>
+std::map<std::string, double> Solver<T>::observables(double x_min,
+                                                     double y_min)
+{
+    const arma::uword n_rows = rpart.n_rows - 1;
+    const arma::uword n_cols = rpart.n_cols - 1;
+
+    const double kin = -h_bar * h_bar / (2 * m);
+
+    double s = 0.0, sx = 0.0, sy = 0.0, se = 0.0, sfx = 0.0, sfy = 0.0;
+
+    #pragma omp parallel for schedule(static) num_threads(threads()) \
+        reduction(+:s, sx, sy, se, sfx, sfy)
+    for (arma::uword j = 1; j < n_cols; ++j)
+    {
+        const double y = y_min + (j - 1) * dy;
+
+        const T *v = V0.colptr(j);
+
+        const T *r  = rpart.colptr(j);
+        const T *rw = rpart.colptr(j - 1);
+        const T *re = rpart.colptr(j + 1);
+
+        const T *i  = ipart.colptr(j);
+        const T *iw = ipart.colptr(j - 1);
+        const T *ie = ipart.colptr(j + 1);
+
+        double cs = 0.0, csx = 0.0, cse = 0.0, cfx = 0.0, cfy = 0.0;
+
+        for (arma::uword l = 1; l < n_rows; ++l)
+        {
+            const double p = (double) r[l] * r[l] + (double) i[l] * i[l];
+
+            const double lr = (r[l - 1] + r[l + 1] - 2.0 * r[l]) / (dx * dx) +
+                              (rw[l] + re[l] - 2.0 * r[l]) / (dy * dy);
+            const double li = (i[l - 1] + i[l + 1] - 2.0 * i[l]) / (dx * dx) +
+                              (iw[l] + ie[l] - 2.0 * i[l]) / (dy * dy);
+
+            cs  += p;
+            csx += (x_min + (l - 1) * dx) * p;
+            cse += kin * (r[l] * lr + i[l] * li) + v[l] * p;
+            cfx += r[l] * (double) (i[l + 1] - i[l - 1]) -
+                   i[l] * (double) (r[l + 1] - r[l - 1]);
+            cfy += r[l] * (double) (ie[l] - iw[l]) -
+                   i[l] * (double) (re[l] - rw[l]);
+        }
+
+        s   += cs;
+        sx  += csx;
+        sy  += y * cs;
+        se  += cse;
+        sfx += cfx;
+        sfy += cfy;
+    }
+
+    std::map<std::string, double> res;
+
+    res["norm"] = std::sqrt(s);
+
+    if (s > 0.0)
+    {
+        res["x"]      = sx / s;
+        res["y"]      = sy / s;
+        res["energy"] = se / s;
+        res["flux_x"] = h_bar / m * sfx / (2 * dx * s);
+        res["flux_y"] = h_bar / m * sfy / (2 * dy * s);
+    }
+
+    return res;
+}
+
+/**
+ * \brief      Replaces the real and imaginary parts.
+ *
+ * The new parts are copied in the current buffers, which must have the same
+ * size, so the scheme buffers and factorizations are kept.
+ *
+ * \param      _rpart  The real part
+ * \param      _ipart  The imaginary part
+ */
+template <typename T>
+void Solver<T>::set_parts(arma::Mat<T> &_rpart, arma::Mat<T> &_ipart)
+{
+    rpart.submat(1, 1, rpart.n_rows - 2, rpart.n_cols - 2) = _rpart;
+    ipart.submat(1, 1, ipart.n_rows - 2, ipart.n_cols - 2) = _ipart;
+}
+
+/**
+ * \brief      Sets the number of threads.
+ *
+ * \param[in]  n     The number of threads, 0 for the OpenMP default
+ */
+template <typename T>
+void Solver<T>::set_threads(unsigned int n)
+{
+    n_threads = n;
+}
+
+/**
+ * \brief      Returns the number of threads.
+ *
+ * \return     The number of threads used by the schemes.
+ */
+template <typename T>
+unsigned int Solver<T>::threads(void)
+{
+#ifdef _OPENMP
+    if (n_threads == 0)
+        return omp_get_max_threads();
+#endif
+
+    return (n_threads == 0) ? 1 : n_threads;
+}
+
 /**
  * \brief      Adds padding to a matrix.
  *
@@ -102,48 +373,560 @@ arma::mat Solver::i_part(void)
  *
  * \return     The matrix with padding.
  */
-arma::mat Solver::padded(const arma::mat m)
+template <typename T>
+arma::Mat<T> Solver<T>::padded(const arma::Mat<T> m)
 {
-    arma::mat res(m.n_rows + 2, m.n_cols + 2, arma::fill::zeros);
+    arma::Mat<T> res(m.n_rows + 2, m.n_cols + 2, arma::fill::zeros);
     res.submat(1, 1, m.n_rows, m.n_cols) = m;
 
     return res;
 }
 
+/**
+ * \brief      Initialises the scheme buffers and constants.
+ *
+ * Resolves the scheme name. The potential term and the stencil coefficients do
+ * not change during a run, so they are computed once here, already multiplied
+ * by the delta time. The buffers of the scheme are allocated once too, the
+ * padding of the FTCS next step buffers stays to zero.
+ */
+template <typename T>
+void Solver<T>::init(void)
+{
+    const_dx = dt * h_bar / (2 * m * dx * dx);
+    const_dy = dt * h_bar / (2 * m * dy * dy);
+
+    potentiel = ((-dt / h_bar) * V0) - 2 * const_dx - 2 * const_dy;
+
+    if (scheme == "ftcs")
+        method = FTCS;
+    else if (scheme == "btcs")
+        method = BTCS;
+    else if (scheme == "ctcs")
+        method = CTCS;
+    else if (scheme == "adi")
+        method = ADI;
+    else if (scheme == "fft")
+        method = FFT;
+    else
+        method = NONE;
+
+    switch (method) {
+    case FTCS:
+        nrpart.zeros(rpart.n_rows, rpart.n_cols);
+        nipart.zeros(ipart.n_rows, ipart.n_cols);
+        break;
+    case BTCS:
+        factorize(1.0);
+        break;
+    case CTCS:
+        factorize(0.5);
+        break;
+    case ADI:
+        thomas();
+        break;
+    case FFT:
+        spectral();
+        break;
+    default:
+        break;
+    }
+}
+
 /**
  * \brief      FTCS compute scheme.
+ *
+ * Applies the 5-point stencil over the interior of the padded matrices, the
+ * steps alternate between the current and the next step buffers. After an odd
+ * number of steps, the result is copied back in the current buffers, so the
+ * memory of the real and imaginary parts never moves: it may be adopted from
+ * the caller, and its views stay valid.
+ *
+ * The interior is cut in strips of FTCS_COLS columns, spread across threads in
+ * contiguous chunks so each thread keeps the same part of the grid from one
+ * step to the next. A strip is swept by tiles of FTCS_ROWS rows, so the
+ * columns shared by neighbouring columns of a tile are still in cache when
+ * they are read again. The threads are created once for the \p n steps.
+ *
+ * \param[in]  n     The number of time steps
+ */
+template <typename T>
+void Solver<T>::ftcs(unsigned int n)
+{
+    const arma::uword n_rows = rpart.n_rows - 1;
+    const arma::uword n_cols = rpart.n_cols - 1;
+
+    arma::Mat<T> *src_r = &rpart, *src_i = &ipart;
+    arma::Mat<T> *dst_r = &nrpart, *dst_i = &nipart;
+
+    #pragma omp parallel num_threads(threads())
+    for (unsigned int k = 0; k < n; ++k)
+    {
+        #pragma omp for schedule(static)
+        for (arma::uword first = 1; first < n_cols; first += FTCS_COLS)
+        {
+            const arma::uword last = std::min(n_cols, first + FTCS_COLS);
+
+            for (arma::uword top = 1; top < n_rows; top += FTCS_ROWS)
+            {
+                const arma::uword bottom = std::min(n_rows, top + FTCS_ROWS);
+
+                for (arma::uword j = first; j < last; ++j)
+                {
+                    const T *pot = potentiel.colptr(j);
+
+                    const T *r  = src_r->colptr(j);
+                    const T *rw = src_r->colptr(j - 1);
+                    const T *re = src_r->colptr(j + 1);
+
+                    const T *i  = src_i->colptr(j);
+                    const T *iw = src_i->colptr(j - 1);
+                    const T *ie = src_i->colptr(j + 1);
+
+                    T *nr = dst_r->colptr(j);
+                    T *ni = dst_i->colptr(j);
+
+                    for (arma::uword l = top; l < bottom; ++l)
+                    {
+                        nr[l] = r[l] - ((pot[l] * i[l]) +
+                                        const_dx * (i[l - 1] + i[l + 1]) +
+                                        const_dy * (iw[l] + ie[l]));
+
+                        ni[l] = i[l] + ((pot[l] * r[l]) +
+                                        const_dx * (r[l - 1] + r[l + 1]) +
+                                        const_dy * (rw[l] + re[l]));
+                    }
+                }
+            }
+        }
+
+        #pragma omp single
+        {
+            std::swap(src_r, dst_r);
+            std::swap(src_i, dst_i);
+        }
+    }
+
+    if (src_r != &rpart)
+    {
+        rpart = nrpart;
+        ipart = nipart;
+    }
+}
+
+/**
+ * \brief      Factorizes the implicit scheme matrix.
+ *
+ * Assembles the matrix (I + i theta dt H / h_bar) of the 2D Hamiltonian over
+ * the interior points, numbered column by column, and computes its LU
+ * factorization in place. The matrix is banded, its bandwidth is the number of
+ * rows, and the fill-in of the factorization stays in the band. It is
+ * diagonally dominant for a non-negative potential, so no pivoting is needed.
+ *
+ * The band is stored as band(bw + i - j, j) = A(i, j).
+ *
+ * \param[in]  theta  The implicit weight of the scheme
  */
-void Solver::ftcs(void)
+template <typename T>
+void Solver<T>::factorize(double theta)
 {
-    double const_dx = h_bar / (2 * m * dx * dx);
-    double const_dy = h_bar / (2 * m * dy * dy);
+    const arma::uword n_rows = rpart.n_rows - 2;
+    const arma::uword n_cols = rpart.n_cols - 2;
+    const arma::uword n      = n_rows * n_cols;
+    const arma::uword bw     = n_rows;
+
+    const cx itheta(0.0, -theta);
+
+    band.zeros(2 * bw + 1, n);
+    psi.zeros(n);
+
+    for (arma::uword j = 0; j < n_cols; ++j)
+    {
+        for (arma::uword l = 0; l < n_rows; ++l)
+        {
+            const arma::uword k = l + j * n_rows;
+
+            band(bw, k) = T(1) + itheta * potentiel(l + 1, j + 1);
+
+            if (l > 0)
+                band(bw + 1, k - 1) = itheta * const_dx;
+
+            if (l < n_rows - 1)
+                band(bw - 1, k + 1) = itheta * const_dx;
+
+            if (j > 0)
+                band(bw + bw, k - bw) = itheta * const_dy;
 
-    arma::mat potentiel = ((-1 / h_bar) * V0) - 2 * const_dx - 2 * const_dy;
+            if (j < n_cols - 1)
+                band(0, k + bw) = itheta * const_dy;
+        }
+    }
+
+    for (arma::uword k = 0; k < n; ++k)
+    {
+        const arma::uword last = std::min(n - 1, k + bw);
+
+        cx *colk = band.colptr(k) + bw - k;
+
+        for (arma::uword i = k + 1; i <= last; ++i)
+            colk[i] /= colk[k];
 
-    arma::mat nrpart = rpart - dt * ((potentiel % ipart) +
-        const_dx * (arma::shift(ipart, -1) + arma::shift(ipart, +1)) +
-        const_dy * (arma::shift(ipart, -1, 1) + arma::shift(ipart, +1, 1)));
+        for (arma::uword j = k + 1; j <= last; ++j)
+        {
+            cx *colj = band.colptr(j) + bw - j;
+            const cx akj = colj[k];
 
-    arma::mat nipart = ipart + dt * ((potentiel % rpart) +
-        const_dx * (arma::shift(rpart, -1) + arma::shift(rpart, +1)) +
-        const_dy * (arma::shift(rpart, -1, 1) + arma::shift(rpart, +1, 1)));
+            if (akj == T(0))
+                continue;
 
-    rpart = nrpart;
-    ipart = nipart;
+            for (arma::uword i = k + 1; i <= last; ++i)
+                sub_mul(colj[i], colk[i], akj);
+        }
+    }
+}
+
+/**
+ * \brief      Implicit compute scheme.
+ *
+ * Builds the right hand side (I - i theta dt H / h_bar) psi with the 5-point
+ * stencil, then solves the system with the factorization computed by
+ * factorize(), by forward and backward substitutions in the band.
+ *
+ * \param[in]  n      The number of time steps
+ * \param[in]  theta  The explicit weight of the scheme
+ */
+template <typename T>
+void Solver<T>::implicit(unsigned int n, double theta)
+{
+    const arma::uword n_rows = rpart.n_rows - 2;
+    const arma::uword n_cols = rpart.n_cols - 2;
+    const arma::uword size   = n_rows * n_cols;
+    const arma::uword bw     = n_rows;
+
+    cx *b = psi.memptr();
+
+    for (unsigned int s = 0; s < n; ++s)
+    {
+        for (arma::uword j = 1; j <= n_cols; ++j)
+        {
+            const T *pot = potentiel.colptr(j);
+
+            const T *r  = rpart.colptr(j);
+            const T *rw = rpart.colptr(j - 1);
+            const T *re = rpart.colptr(j + 1);
+
+            const T *i  = ipart.colptr(j);
+            const T *iw = ipart.colptr(j - 1);
+            const T *ie = ipart.colptr(j + 1);
+
+            cx *bj = b + (j - 1) * n_rows;
+
+            for (arma::uword l = 1; l <= n_rows; ++l)
+            {
+                const T lr = (pot[l] * r[l]) +
+                             const_dx * (r[l - 1] + r[l + 1]) +
+                             const_dy * (rw[l] + re[l]);
+
+                const T li = (pot[l] * i[l]) +
+                             const_dx * (i[l - 1] + i[l + 1]) +
+                             const_dy * (iw[l] + ie[l]);
+
+                bj[l - 1] = cx(r[l] - theta * li, i[l] + theta * lr);
+            }
+        }
+
+        for (arma::uword k = 0; k < size; ++k)
+        {
+            const arma::uword last = std::min(size - 1, k + bw);
+            const cx *colk = band.colptr(k) + bw - k;
+            const cx bk = b[k];
+
+            for (arma::uword i = k + 1; i <= last; ++i)
+                sub_mul(b[i], colk[i], bk);
+        }
+
+        for (arma::uword k = size; k-- > 0;)
+        {
+            const arma::uword first = (k > bw) ? k - bw : 0;
+            const cx *colk = band.colptr(k) + bw - k;
+
+            b[k] /= colk[k];
+
+            const cx bk = b[k];
+
+            for (arma::uword i = first; i < k; ++i)
+                sub_mul(b[i], colk[i], bk);
+        }
+
+        for (arma::uword j = 1; j <= n_cols; ++j)
+        {
+            const cx *bj = b + (j - 1) * n_rows;
+
+            T *r = rpart.colptr(j);
+            T *i = ipart.colptr(j);
+
+            for (arma::uword l = 1; l <= n_rows; ++l)
+            {
+                r[l] = bj[l - 1].real();
+                i[l] = bj[l - 1].imag();
+            }
+        }
+    }
 }
 
 /**
  * \brief      BTCS compute scheme.
+ *
+ * Backward Euler: solves (I + i dt H / h_bar) psi' = psi at each time step.
+ *
+ * \param[in]  n     The number of time steps
  */
-void Solver::btcs(void)
+template <typename T>
+void Solver<T>::btcs(unsigned int n)
 {
-    /* TODO */
+    implicit(n, 0.0);
 }
 
 /**
  * \brief      CTCS compute scheme.
+ *
+ * Crank-Nicolson: solves (I + i dt H / 2 h_bar) psi' = (I - i dt H / 2 h_bar)
+ * psi at each time step, which preserves the norm.
+ *
+ * \param[in]  n     The number of time steps
  */
-void Solver::ctcs(void)
+template <typename T>
+void Solver<T>::ctcs(unsigned int n)
 {
-    /* TODO */
+    implicit(n, 0.5);
 }
+
+/**
+ * \brief      Prepares the ADI tridiagonal systems.
+ *
+ * The ADI scheme splits the Hamiltonian in a x part and a y part, each one with
+ * half of the potential. The tridiagonal matrices (I + i dt Hx / 2 h_bar) of
+ * the x-lines and (I + i dt Hy / 2 h_bar) of the y-lines do not change during
+ * a run, so the inverse pivots of their Thomas elimination are computed once.
+ */
+template <typename T>
+void Solver<T>::thomas(void)
+{
+    const arma::uword n_rows = rpart.n_rows - 1;
+    const arma::uword n_cols = rpart.n_cols - 1;
+
+    const cx offx(0.0, -0.5 * const_dx);
+    const cx offy(0.0, -0.5 * const_dy);
+
+    cpsi.zeros(rpart.n_rows, rpart.n_cols);
+    chalf.zeros(rpart.n_rows, rpart.n_cols);
+    invx.zeros(rpart.n_rows, rpart.n_cols);
+    invy.zeros(rpart.n_rows, rpart.n_cols);
+
+    for (arma::uword j = 1; j < n_cols; ++j)
+    {
+        for (arma::uword l = 1; l < n_rows; ++l)
+        {
+            const T ax = T(0.5) * potentiel(l, j) + const_dy - const_dx;
+            const T ay = T(0.5) * potentiel(l, j) + const_dx - const_dy;
+
+            cx bx(1.0, -0.5 * ax);
+            cx by(1.0, -0.5 * ay);
+
+            if (l > 1)
+                bx -= mul(mul(offx, offx), invx(l - 1, j));
+
+            if (j > 1)
+                by -= mul(mul(offy, offy), invy(l, j - 1));
+
+            invx(l, j) = T(1) / bx;
+            invy(l, j) = T(1) / by;
+        }
+    }
+}
+
+/**
+ * \brief      ADI compute scheme.
+ *
+ * Peaceman-Rachford scheme: each time step is a x-sweep, implicit in x and
+ * explicit in y, followed by a y-sweep, implicit in y and explicit in x. Each
+ * sweep solves independent tridiagonal systems with the Thomas algorithm. The
+ * x-lines are spread across threads one by one, the y-lines by blocks of rows
+ * so each thread reads and writes contiguous memory.
+ *
+ * \param[in]  n     The number of time steps
+ */
+template <typename T>
+void Solver<T>::adi(unsigned int n)
+{
+    const arma::uword n_rows = rpart.n_rows - 1;
+    const arma::uword n_cols = rpart.n_cols - 1;
+
+    const cx offx(0.0, -0.5 * const_dx);
+    const cx offy(0.0, -0.5 * const_dy);
+
+    for (arma::uword j = 1; j < n_cols; ++j)
+        for (arma::uword l = 1; l < n_rows; ++l)
+            cpsi(l, j) = cx(rpart(l, j), ipart(l, j));
+
+    for (unsigned int s = 0; s < n; ++s)
+    {
+        #pragma omp parallel for schedule(static) num_threads(threads())
+        for (arma::uword j = 1; j < n_cols; ++j)
+        {
+            const T *pot = potentiel.colptr(j);
+            const cx *inv = invx.colptr(j);
+
+            const cx *p  = cpsi.colptr(j);
+            const cx *pw = cpsi.colptr(j - 1);
+            const cx *pe = cpsi.colptr(j + 1);
+
+            cx *h = chalf.colptr(j);
+            cx prev(0.0, 0.0);
+
+            for (arma::uword l = 1; l < n_rows; ++l)
+            {
+                const T ay = T(0.5) * pot[l] + const_dx - const_dy;
+                const cx ly = ay * p[l] + const_dy * (pw[l] + pe[l]);
+                const cx d(p[l].real() - 0.5 * ly.imag(),
+                                        p[l].imag() + 0.5 * ly.real());
+
+                prev = mul(d - mul(offx, prev), inv[l]);
+                h[l] = prev;
+            }
+
+            for (arma::uword l = n_rows - 2; l > 0; --l)
+                sub_mul(h[l], mul(offx, inv[l]), h[l + 1]);
+        }
+
+        #pragma omp parallel for schedule(static) num_threads(threads())
+        for (arma::uword first = 1; first < n_rows; first += ADI_BLOCK)
+        {
+            const arma::uword last = std::min(n_rows, first + ADI_BLOCK);
+
+            for (arma::uword j = 1; j < n_cols; ++j)
+            {
+                const T *pot = potentiel.colptr(j);
+                const cx *inv = invy.colptr(j);
+                const cx *h   = chalf.colptr(j);
+                const cx *pw  = cpsi.colptr(j - 1);
+
+                cx *p = cpsi.colptr(j);
+
+                for (arma::uword l = first; l < last; ++l)
+                {
+                    const T ax = T(0.5) * pot[l] + const_dy - const_dx;
+                    const cx lx = ax * h[l] + const_dx * (h[l - 1] + h[l + 1]);
+                    const cx d(h[l].real() - 0.5 * lx.imag(),
+                                            h[l].imag() + 0.5 * lx.real());
+
+                    p[l] = mul(d - mul(offy, pw[l]), inv[l]);
+                }
+            }
+
+            for (arma::uword j = n_cols - 2; j > 0; --j)
+            {
+                const cx *inv = invy.colptr(j);
+                const cx *pe  = cpsi.colptr(j + 1);
+
+                cx *p = cpsi.colptr(j);
+
+                for (arma::uword l = first; l < last; ++l)
+                    sub_mul(p[l], mul(offy, inv[l]), pe[l]);
+            }
+        }
+    }
+
+    for (arma::uword j = 1; j < n_cols; ++j)
+    {
+        for (arma::uword l = 1; l < n_rows; ++l)
+        {
+            rpart(l, j) = cpsi(l, j).real();
+            ipart(l, j) = cpsi(l, j).imag();
+        }
+    }
+}
+
+/**
+ * \brief      Prepares the split-step Fourier phase factors.
+ *
+ * The potential half step exp(-i V dt / 2 h_bar) is applied in real space, the
+ * kinetic step exp(-i h_bar k^2 dt / 2 m) in Fourier space, over the interior
+ * points with periodic boundaries. Both phase factors are computed once, as
+ * well as the full potential step used between two consecutive time steps.
+ */
+template <typename T>
+void Solver<T>::spectral(void)
+{
+    const arma::uword n_rows = rpart.n_rows - 2;
+    const arma::uword n_cols = rpart.n_cols - 2;
+
+    const double dkx = 2 * arma::datum::pi / (n_rows * dx);
+    const double dky = 2 * arma::datum::pi / (n_cols * dy);
+
+    arma::Mat<T> half = 0.5 * (potentiel.submat(1, 1, n_rows, n_cols) +
+                            2 * const_dx + 2 * const_dy);
+
+    phase_v  = arma::exp(cx_mat(arma::zeros<arma::Mat<T> >(n_rows, n_cols),
+                                half));
+    phase_vv = phase_v % phase_v;
+
+    phase_k.set_size(n_rows, n_cols);
+
+    for (arma::uword j = 0; j < n_cols; ++j)
+    {
+        const double ky = dky * ((j <= (n_cols - 1) / 2) ? (double) j :
+                                 (double) j - (double) n_cols);
+
+        for (arma::uword l = 0; l < n_rows; ++l)
+        {
+            const double kx = dkx * ((l <= (n_rows - 1) / 2) ? (double) l :
+                                     (double) l - (double) n_rows);
+
+            const double angle = -dt * h_bar * (kx * kx + ky * ky) / (2 * m);
+
+            phase_k(l, j) = cx(std::cos(angle), std::sin(angle));
+        }
+    }
+
+    cpsi.zeros(n_rows, n_cols);
+}
+
+/**
+ * \brief      Split-step Fourier compute scheme.
+ *
+ * Strang splitting: a potential half step, a kinetic step, and a potential
+ * half step. The two potential half steps between consecutive time steps are
+ * merged in a single full step.
+ *
+ * \param[in]  n     The number of time steps
+ */
+template <typename T>
+void Solver<T>::fft(unsigned int n)
+{
+    if (n == 0)
+        return;
+
+    const arma::uword n_rows = rpart.n_rows - 2;
+    const arma::uword n_cols = rpart.n_cols - 2;
+
+    cpsi = cx_mat(rpart.submat(1, 1, n_rows, n_cols),
+                        ipart.submat(1, 1, n_rows, n_cols));
+    cpsi %= phase_v;
+
+    for (unsigned int s = 0; s < n; ++s)
+    {
+        cpsi = arma::ifft2(arma::fft2(cpsi) % phase_k);
+
+        if (s < n - 1)
+            cpsi %= phase_vv;
+        else
+            cpsi %= phase_v;
+    }
+
+    rpart.submat(1, 1, n_rows, n_cols) = arma::real(cpsi);
+    ipart.submat(1, 1, n_rows, n_cols) = arma::imag(cpsi);
+}
+
+template class Solver<double>;
+template class Solver<float>;
@@ -4,8 +4,20 @@
 #ifndef SOLVER_H
 #define SOLVER_H
 
+#include <map>
+#include <string>
+
 #include <armadillo>
 
+/**
+ * \brief      2D-FD solver.
+ *
+ * The solver computes in the precision of \p T: double, or float to halve the
+ * memory traffic of the schemes.
+ *
+ * \tparam     T     The real type
+ */
+template <typename T>
 class Solver
 {
 public:
@@ -20,7 +32,7 @@ public:
      * \param[in]  <unnamed>  The y speed
      * \param[in]  <unnamed>  The delta time
      */
-    Solver(arma::mat&, arma::mat&, arma::mat&,
+    Solver(arma::Mat<T>&, arma::Mat<T>&, arma::Mat<T>&,
            std::string, double, double, double);
 
     /**
@@ -36,36 +48,125 @@ public:
      * \param[in]  <unnamed>  The y speed
      * \param[in]  <unnamed>  The delta time
      */
-    Solver(arma::mat&, arma::mat&, arma::mat&, double, double,
+    Solver(arma::Mat<T>&, arma::Mat<T>&, arma::Mat<T>&, double, double,
            std::string, double, double, double);
 
     /**
-     * \brief      Compute the next psi value.
+     * \brief      Solver constructor.
+     *
+     * \param      <unnamed>  The padded potentiel field
+     * \param      <unnamed>  The padded real part
+     * \param      <unnamed>  The padded imaginary part
+     * \param[in]  <unnamed>  The Planck constant
+     * \param[in]  <unnamed>  The particle masse
+     * \param[in]  <unnamed>  The scheme
+     * \param[in]  <unnamed>  The x speed
+     * \param[in]  <unnamed>  The y speed
+     * \param[in]  <unnamed>  The delta time
+     * \param[in]  <unnamed>  Whether the parts become the solver storage
+     */
+    Solver(arma::Mat<T>&, arma::Mat<T>&, arma::Mat<T>&, double, double,
+           std::string, double, double, double, bool);
+
+    /**
+     * \brief      Compute the next psi values.
+     *
+     * \param[in]  <unnamed>  The number of time steps
      */
-    void compute(void);
+    void compute(unsigned int = 1);
 
     /**
      * \brief      Returns the real part.
      *
      * \return     The current real part.
      */
-    arma::mat r_part(void);
+    arma::Mat<T> r_part(void);
 
     /**
      * \brief      Returns the imaginary part.
      *
      * \return     The current imaginary part.
      */
-    arma::mat i_part(void);
+    arma::Mat<T> i_part(void);
+
+    /**
+     * \brief      Returns the padded real part.
+     *
+     * \return     The storage of the real part.
+     */
+    arma::Mat<T> &r_padded(void);
+
+    /**
+     * \brief      Returns the padded imaginary part.
+     *
+     * \return     The storage of the imaginary part.
+     */
+    arma::Mat<T> &i_padded(void);
+
+    /**
+     * \brief      Computes the observables of psi.
+     *
+     * \param[in]  <unnamed>  The x coordinate of the first row
+     * \param[in]  <unnamed>  The y coordinate of the first column
+     *
+     * \return     The norm, the mean position, energy and flux of psi.
+     */
+    std::map<std::string, double> observables(double, double);
+
+    /**
+     * \brief      Replaces the real and imaginary parts.
+     *
+     * \param      <unnamed>  The real part
+     * \param      <unnamed>  The imaginary part
+     */
+    void set_parts(arma::Mat<T>&, arma::Mat<T>&);
+
+    /**
+     * \brief      Sets the number of threads.
+     *
+     * \param[in]  <unnamed>  The number of threads, 0 for the OpenMP default
+     */
+    void set_threads(unsigned int);
+
+    /**
+     * \brief      Returns the number of threads.
+     *
+     * \return     The number of threads used by the schemes.
+     */
+    unsigned int threads(void);
 
 private:
-    arma::mat V0;
-    arma::mat rpart, ipart;
+    typedef std::complex<T> cx;
+    typedef arma::Mat<cx> cx_mat;
+    typedef arma::Col<cx> cx_vec;
+
+    arma::Mat<T> V0;
+    arma::Mat<T> rpart, ipart;
+    arma::Mat<T> nrpart, nipart;
+    arma::Mat<T> potentiel;
+
+    cx_mat band;
+    cx_vec psi;
+
+    cx_mat cpsi, chalf;
+    cx_mat invx, invy;
+
+    cx_mat phase_v, phase_vv, phase_k;
 
     std::string scheme;
 
+    enum Method { NONE, FTCS, BTCS, CTCS, ADI, FFT } method;
+
     double h_bar, m;
     double dx, dy, dt;
+    T const_dx, const_dy;
+
+    unsigned int n_threads;
+
+    /**
+     * \brief      Initialises the scheme buffers and constants.
+     */
+    void init(void);
 
     /**
      * \brief      Adds padding to a matrix.
@@ -74,22 +175,67 @@ private:
      *
      * \return     The matrix with padding.
      */
-    arma::mat padded(arma::mat);
+    arma::Mat<T> padded(arma::Mat<T>);
 
     /**
      * \brief      FTCS compute scheme.
+     *
+     * \param[in]  <unnamed>  The number of time steps
+     */
+    void ftcs(unsigned int);
+
+    /**
+     * \brief      Factorizes the implicit scheme matrix.
+     *
+     * \param[in]  <unnamed>  The implicit weight of the scheme
+     */
+    void factorize(double);
+
+    /**
+     * \brief      Implicit compute scheme.
+     *
+     * \param[in]  <unnamed>  The number of time steps
+     * \param[in]  <unnamed>  The explicit weight of the scheme
      */
-    void ftcs(void);
+    void implicit(unsigned int, double);
 
     /**
      * \brief      BTCS compute scheme:
+     *
+     * \param[in]  <unnamed>  The number of time steps
      */
-    void btcs(void);
+    void btcs(unsigned int);
 
     /**
      * \brief      CTCS compute scheme.
+     *
+     * \param[in]  <unnamed>  The number of time steps
+     */
+    void ctcs(unsigned int);
+
+    /**
+     * \brief      Prepares the ADI tridiagonal systems.
+     */
+    void thomas(void);
+
+    /**
+     * \brief      ADI compute scheme.
+     *
+     * \param[in]  <unnamed>  The number of time steps
+     */
+    void adi(unsigned int);
+
+    /**
+     * \brief      Prepares the split-step Fourier phase factors.
+     */
+    void spectral(void);
+
+    /**
+     * \brief      Split-step Fourier compute scheme.
+     *
+     * \param[in]  <unnamed>  The number of time steps
      */
-    void ctcs(void);
+    void fft(unsigned int);
 };
 
 #endif /* solver.h */
@@ -1,4 +1,5 @@
 import numpy as np
+import os
 import time
 
 import solver
@@ -14,6 +15,25 @@ N_Y   = 101
 
 DT = 0.02 / 800
 
+SPAN = 1000
+
+SCALING_N    = 1000
+SCALING_SPAN = 20
+
+SCHEMES = {
+    "btcs": 0.02 / 40,
+    "ctcs": 0.02 / 4,
+    "adi":  0.02 / 4,
+    "fft":  0.02,
+}
+
+
+def padded(m):
+    res = np.zeros((m.shape[0] + 2, m.shape[1] + 2), order = 'F')
+    res[1:-1, 1:-1] = m
+
+    return res
+
 
 def gaussian(x0, y0, w, A, kx, ky):
     X = np.linspace(X_MIN, X_MAX, N_X)
@@ -41,6 +61,100 @@ def potential_2D_HO():
     return v0
 
 
+def bench_scheme(psi, V0, scheme, dt):
+    solv = solver.Solver(np.asfortranarray(V0), np.asfortranarray(np.real(psi)),
+                         np.asfortranarray(np.imag(psi)), 1.0, 1.0, scheme,
+                         (X_MAX - X_MIN) / N_X, (Y_MAX - Y_MIN) / N_Y, dt)
+
+    steps = round(SPAN * DT / dt)
+
+    begin = time.time()
+    solv.compute(steps)
+    end = time.time()
+
+    psi = solv.r_part() + 1j * solv.i_part()
+    print("%s: %f after %d steps, time elapsed: %f"
+          % (scheme, np.linalg.norm(psi), steps, end - begin))
+
+    observables = solv.observables(X_MIN, Y_MIN)
+    print("%s: norm %f, <x> %f, <y> %f, energy %f"
+          % (scheme, observables['norm'], observables['x'], observables['y'],
+             observables['energy']))
+
+
+def check_precision(psi, V0, scheme, dt):
+    args = (1.0, 1.0, scheme, (X_MAX - X_MIN) / N_X, (Y_MAX - Y_MIN) / N_Y, dt)
+    res  = []
+
+    for Solver, dtype in ((solver.Solver, np.float64),
+                          (solver.Solver32, np.float32)):
+        solv = Solver(np.asfortranarray(V0, dtype = dtype),
+                      np.asfortranarray(np.real(psi), dtype = dtype),
+                      np.asfortranarray(np.imag(psi), dtype = dtype), *args)
+        solv.compute(round(SPAN * DT / dt))
+        res.append(solv.r_part() + 1j * solv.i_part())
+
+    print("%s: single precision relative error %e"
+          % (scheme, np.linalg.norm(res[1] - res[0]) / np.linalg.norm(res[0])))
+
+
+def check_views(psi, V0, scheme, dt):
+    args = (1.0, 1.0, scheme, (X_MAX - X_MIN) / N_X, (Y_MAX - Y_MIN) / N_Y, dt)
+
+    copied = solver.Solver(np.asfortranarray(V0), np.asfortranarray(np.real(psi)),
+                           np.asfortranarray(np.imag(psi)), *args)
+
+    r = padded(np.real(psi))
+    i = padded(np.imag(psi))
+    adopted = solver.Solver(padded(V0), r, i, *args, True)
+
+    view = adopted.r_view()
+
+    for n in (1, 2):
+        copied.compute(n)
+        adopted.compute(n)
+
+    same = (np.array_equal(view, copied.r_part())
+            and np.array_equal(r[1:-1, 1:-1], copied.r_part())
+            and np.array_equal(adopted.i_view(), copied.i_part()))
+
+    print("%s: adopted buffers and views %s, read-only %s"
+          % (scheme, "match" if same else "differ", not view.flags.writeable))
+
+
+def bench_scaling(scheme, dt):
+    n  = SCALING_N
+    V0 = np.zeros((n, n), order = 'F')
+    r  = np.asfortranarray(np.random.rand(n, n))
+    i  = np.asfortranarray(np.random.rand(n, n))
+
+    solv = solver.Solver(V0, r, i, 1.0, 1.0, scheme, 20 / n, 20 / n, dt)
+
+    threads = [1]
+
+    while threads[-1] * 2 <= (os.cpu_count() or 1):
+        threads.append(threads[-1] * 2)
+
+    if threads[-1] != os.cpu_count():
+        threads.append(os.cpu_count())
+
+    base = None
+
+    for t in threads:
+        solv.set_threads(t)
+        solv.compute()
+
+        begin = time.time()
+        solv.compute(SCALING_SPAN)
+        end = time.time()
+
+        rate = SCALING_SPAN / (end - begin)
+        base = base or rate
+
+        print("%s %dx%d, %d threads: %f steps per second, speedup %.2f"
+              % (scheme, n, n, t, rate, rate / base))
+
+
 def main():
     psi = gaussian(0, 0, 2.06, 1 / np.sqrt(2 * np.pi), 0, 0)
     V0  = potential_2D_HO()
@@ -60,6 +174,29 @@ def main():
 
     print("Calculation terminated, time elapsed: %f" % (end - begin))
 
+    begin = time.time()
+    solv.compute(SPAN)
+    end = time.time()
+
+    psi = solv.r_part() + 1j * solv.i_part()
+    print(np.linalg.norm(psi))
+
+    print("%d steps computed, steps per second: %f" % (SPAN, SPAN / (end - begin)))
+
+    psi = gaussian(0, 0, 2.06, 1 / np.sqrt(2 * np.pi), 0, 0)
+
+    for scheme, dt in SCHEMES.items():
+        bench_scheme(psi, V0, scheme, dt)
+
+    for scheme, dt in SCHEMES.items():
+        check_precision(psi, V0, scheme, dt)
+
+    for scheme, dt in {"ftcs": DT, **SCHEMES}.items():
+        check_views(psi, V0, scheme, dt)
+
+    bench_scaling("ftcs", 1e-6)
+    bench_scaling("adi", 1e-3)
+
 
 if __name__ == "__main__":
     main()
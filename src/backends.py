@@ -0,0 +1,74 @@
+""" @package backends.py
+Provides the solver backends.
+
+The backends package maps each backend name to the module providing its Solver
+class. A backend module is only imported when it is requested, so a missing
+native extension does not prevent the other backends from being used.
+"""
+import importlib
+
+import logging
+
+
+# Modules providing a Solver class, by backend name.
+BACKENDS = {
+    # "name": "module",
+    "native": "solver",
+    "numpy": "numpySolver",
+    "distributed": "distributedSolver",
+}
+
+# Backend used when the requested one can't be imported.
+FALLBACK = "numpy"
+
+# Solver class names, by precision.
+PRECISIONS = {
+    "double": "Solver",
+    "single": "Solver32",
+}
+
+
+def register(name, module):
+    """ Registers a backend.
+
+    @param name   the backend name,
+    @param module the name of the module providing the Solver class.
+    """
+    BACKENDS[name] = module
+
+
+def load(name, precision = "double"):
+    """ Loads a backend.
+
+    The load() function returns the Solver class of the backend \a name, in
+    the given \a precision. If the backend module can't be imported, then the
+    fallback backend is used instead.
+
+    @param name      the backend name,
+    @param precision the floating point precision, "double" or "single".
+
+    @return the Solver class of the backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown solver backend: %s" % (name))
+
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision: %s" % (precision))
+
+    try:
+        module = importlib.import_module(BACKENDS[name])
+    except ImportError as e:
+        if name == FALLBACK:
+            raise
+
+        logging.warning("Solver backend %s unavailable (%s), falling back to %s"
+                        % (name, str(e), FALLBACK))
+        return load(FALLBACK, precision)
+
+    if not hasattr(module, PRECISIONS[precision]):
+        raise ValueError("Solver backend %s has no %s precision"
+                         % (name, precision))
+
+    logging.info("Using solver backend %s, %s precision" % (name, precision))
+
+    return getattr(module, PRECISIONS[precision])
@@ -0,0 +1,428 @@
+""" @package benchmark.py
+Provides the performance benchmark suite.
+
+A benchmark spec is a JSON file holding the base parameters, or the path to a
+parameters file, and the cases to measure:
+
+    {
+        "base": "config/param.json",
+        "grids": [101, 256, 512],
+        "schemes": ["ftcs", "btcs", "adi", "fft"],
+        "scheme_grids": {"btcs": [101, 256]},
+        "backends": ["native", "numpy"],
+        "threads": [1, 0],
+        "storages": ["local", "mongodb"],
+        "steps": 20,
+        "snapshots": 8,
+        "repeat": 3
+    }
+
+The suite measures the solver for each backend, scheme, grid (the
+scheme_grids of the scheme, if any) and number of threads, the initial-state
+generators for each grid, and the snapshot encoding, insertion and extraction
+for each storage and grid. Each case runs in its own process, so its peak
+memory is not hidden by the previous ones, and keeps its best time over repeat
+runs.
+
+The report is a JSON file with the machine description and the metrics of each
+case, by case name. compare() flags the metrics of a report which are worse
+than the ones of a baseline report.
+"""
+import os
+import platform
+import resource
+import shutil
+import tempfile
+
+import json
+
+import multiprocessing
+
+import logging
+
+import time
+
+import numpy as np
+
+import backends
+import fieldGenerator
+import grid
+import monitor
+import stability
+import storage
+
+from const import *
+
+
+# Metrics compared with the baseline: 1 if higher is better, -1 if lower is.
+METRICS = {
+    # "metric": direction,
+    "steps_per_second": 1,
+    "ns_per_cell": -1,
+    "setup": -1,
+    "time": -1,
+    "encode": -1,
+    "insert": -1,
+    "extract": -1,
+    "memory": -1,
+}
+
+# Absolute changes never flagged, by metric: they are within the noise of the
+# allocator (in MiB) or of the timer (in seconds).
+SLACK = {
+    # "metric": change,
+    "setup": 1e-4,
+    "time": 1e-4,
+    "encode": 1e-4,
+    "insert": 1e-4,
+    "extract": 1e-4,
+    "memory": 1.0,
+}
+
+
+def best_time(fun, repeat):
+    """ Returns the best time of a function.
+
+    @param fun    the function,
+    @param repeat the number of runs.
+
+    @return the shortest time of a run, in seconds.
+    """
+    times = []
+
+    for _ in range(max(repeat, 1)):
+        begin = time.perf_counter()
+        fun()
+        times.append(time.perf_counter() - begin)
+
+    return min(times)
+
+
+def states(param, n):
+    """ Generates the initial states of a case.
+
+    @param param the base parameters,
+    @param n     the number of points along x and y.
+
+    @return the parameters, the grid, psi and V0 of the case.
+    """
+    param = dict(param, nx = n, ny = n)
+    psi, v0 = fieldGenerator.init_states(param)
+
+    return param, grid.from_config(param), psi, v0
+
+
+def solver_case(param, backend, scheme, n, threads, steps, repeat):
+    """ Measures the solver.
+
+    The time step of the scheme is derived from the grid, as for a run with
+    dt set to auto.
+
+    @param param   the base parameters,
+    @param backend the solver backend,
+    @param scheme  the scheme,
+    @param n       the number of points along x and y,
+    @param threads the number of threads, 0 for the default,
+    @param steps   the number of time steps by run,
+    @param repeat  the number of runs.
+
+    @return the metrics of the case.
+    """
+    param, g, psi, v0 = states(dict(param, scheme = scheme), n)
+    precision = param.get('precision', "double")
+    real, _ = TYPES[precision]
+
+    dt = stability.time_step(scheme, g, v0, param.get('t_max', T_MAX))
+    Solver = backends.load(backend, precision)
+
+    args = (np.array(v0, dtype = real, order = 'F'),
+            np.asfortranarray(np.real(psi), dtype = real),
+            np.asfortranarray(np.imag(psi), dtype = real),
+            H_BAR, M, scheme, g.dx, g.dy, dt)
+
+    begin = time.perf_counter()
+    solv = Solver(*args)
+    setup = time.perf_counter() - begin
+
+    solv.set_threads(threads)
+
+    try:
+        solv.compute(1)
+        elapsed = best_time(lambda: solv.compute(steps), repeat)
+        used = solv.threads()
+    finally:
+        if hasattr(solv, "close"):
+            solv.close()
+
+    return {"steps_per_second": steps / elapsed,
+            "ns_per_cell": 1e9 * elapsed / (steps * g.n_x * g.n_y),
+            "setup": setup, "threads": used}
+
+
+def generator_case(param, n, repeat):
+    """ Measures the initial-state generators.
+
+    @param param  the base parameters,
+    @param n      the number of points along x and y,
+    @param repeat the number of runs.
+
+    @return the metrics of the case.
+    """
+    param = dict(param, nx = n, ny = n)
+
+    return {"time": best_time(lambda: fieldGenerator.init_states(param), repeat)}
+
+
+def snapshot_case(param, backend, n, count, repeat, mongodb):
+    """ Measures the snapshots serialization.
+
+    The snapshot_case() function times the encoding of a snapshot, the
+    insertion of \a count snapshots in a single batch and their extraction by
+    the monitor, from a run written for the benchmark then discarded. The local
+    storage is written in a temporary directory.
+
+    @param param   the base parameters,
+    @param backend the storage backend,
+    @param n       the number of points along x and y,
+    @param count   the number of snapshots,
+    @param repeat  the number of runs,
+    @param mongodb the MongoDB instance.
+
+    @return the metrics of the case, in seconds by snapshot.
+    """
+    param, g, psi, v0 = states(param, n)
+    path = tempfile.mkdtemp()
+    mongodb = dict(mongodb, collection = mongodb['collection'] + "_benchmark")
+    checksum = "benchmark_%d" % (n)
+
+    try:
+        db = storage.connect(mongodb, {"backend": backend, "path": path})
+        db.discard(checksum)
+        db.insert_run({"checksum": checksum, "v0": db.encode(v0),
+                       "scheme": param['scheme'], "span": 1,
+                       "grid": [g.x_min, g.x_max, g.n_x,
+                                g.y_min, g.y_max, g.n_y],
+                       "t_max": count, "dt": 1, "checkpoint": 0,
+                       "status": "done"})
+
+        encode = best_time(lambda: db.encode(psi), repeat)
+
+        def insert():
+            db.discard(checksum, -1)
+            db.insert_many([{"checksum": checksum, "t": t,
+                             "psi": db.encode(psi), "norm": 1.0}
+                            for t in range(count)], j = True)
+
+        def extract():
+            for document in db.retrieve_all({"checksum": checksum}):
+                monitor.extract(db, document)
+
+        insert_time  = best_time(insert, repeat)
+        extract_time = best_time(extract, repeat)
+
+        db.discard(checksum)
+    finally:
+        shutil.rmtree(path, ignore_errors = True)
+
+    return {"encode": encode, "insert": insert_time / count,
+            "extract": extract_time / count}
+
+
+# Case functions, by case kind.
+CASES = {
+    # "kind": function,
+    "solver": solver_case,
+    "generator": generator_case,
+    "snapshot": snapshot_case,
+}
+
+
+def run_case(kind, args):
+    """ Runs a case in a worker process.
+
+    The memory metric is the growth of the peak resident size of the process
+    during the case, in MiB.
+
+    @param kind the case kind,
+    @param args the arguments of the case function.
+
+    @return the metrics of the case.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics = CASES[kind](**args)
+    metrics['memory'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                         - peak) / 1024
+
+    return metrics
+
+
+def expand(spec, settings):
+    """ Expands a benchmark spec.
+
+    @param spec     the benchmark spec,
+    @param settings the settings.
+
+    @return the name, the kind and the arguments of each case.
+    """
+    base = spec['base']
+
+    if isinstance(base, str):
+        with open(base, "r") as read_file:
+            base = json.load(read_file)
+
+    grids  = spec.get('grids', [N_X])
+    repeat = spec.get('repeat', 3)
+    cases  = []
+
+    for backend in spec.get('backends', ["native"]):
+        for scheme in spec.get('schemes', [base['scheme']]):
+            for n in spec.get('scheme_grids', {}).get(scheme, grids):
+                for threads in spec.get('threads', [0]):
+                    name = "solver/%s/%s/%dx%d/%s" % (backend, scheme, n, n,
+                                                      threads or "default")
+                    cases.append((name, "solver", {
+                        "param": base, "backend": backend, "scheme": scheme,
+                        "n": n, "threads": threads,
+                        "steps": spec.get('steps', 20), "repeat": repeat}))
+
+    for n in grids:
+        cases.append(("generator/%dx%d" % (n, n), "generator",
+                      {"param": base, "n": n, "repeat": repeat}))
+
+    for backend in spec.get('storages', ["local"]):
+        for n in grids:
+            cases.append(("snapshot/%s/%dx%d" % (backend, n, n), "snapshot", {
+                "param": base, "backend": backend, "n": n,
+                "count": spec.get('snapshots', 8), "repeat": repeat,
+                "mongodb": settings['mongodb']}))
+
+    return cases
+
+
+def machine():
+    """ Describes the machine.
+
+    @return the machine description.
+    """
+    return {"platform": platform.platform(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "python": platform.python_version(),
+            "numpy": np.__version__,
+            "omp_num_threads": os.environ.get('OMP_NUM_THREADS')}
+
+
+def run(spec_file, settings):
+    """ Benchmark main function.
+
+    The run() function measures the cases of \a spec_file one at a time, each
+    one in a new process, then writes the report.
+
+    @param spec_file the path to the benchmark spec,
+    @param settings  the settings.
+
+    @return the report.
+    """
+    with open(spec_file, "r") as read_file:
+        spec = json.load(read_file)
+
+    report_file = settings.get('benchmark', {}).get('report', "benchmark.json")
+    cases = expand(spec, settings)
+    results = {}
+
+    logging.info("Benchmark of %d cases" % (len(cases)))
+
+    context = multiprocessing.get_context("spawn")
+
+    for name, kind, args in cases:
+        with context.Pool(1, maxtasksperchild = 1) as pool:
+            try:
+                results[name] = pool.apply(run_case, (kind, args))
+                logging.info("Case %s done" % (name))
+            except Exception as e:
+                logging.error("Case %s failed: %s" % (name, str(e)))
+
+        print_case(name, results.get(name))
+
+    report = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "machine": machine(), "spec": spec, "cases": results}
+
+    with open(report_file, "w") as write_file:
+        json.dump(report, write_file, indent = 4)
+
+    print("Report written in %s" % (report_file))
+
+    return report
+
+
+def print_case(name, metrics):
+    """ Prints the metrics of a case.
+
+    @param name    the case name,
+    @param metrics the metrics of the case, None if it failed.
+    """
+    if metrics == None:
+        print("%-40s failed" % (name))
+        return
+
+    values = ["%s %.4g" % (key, metrics[key]) for key in METRICS
+              if key in metrics]
+    print("%-40s %s" % (name, ", ".join(values)))
+
+
+def compare(report_file, baseline_file, tolerance = 0.1):
+    """ Compares a report with a baseline.
+
+    The compare() function prints the relative change of each metric of the
+    cases found in both reports, and flags the changes worse than
+    \a tolerance as regressions.
+
+    @param report_file   the path to the report,
+    @param baseline_file the path to the baseline report,
+    @param tolerance     the relative change allowed.
+
+    @return the regressions found, as (case, metric, baseline, value).
+    """
+    with open(report_file, "r") as read_file:
+        report = json.load(read_file)
+
+    with open(baseline_file, "r") as read_file:
+        baseline = json.load(read_file)
+
+    if report['machine'] != baseline['machine']:
+        logging.warning("The report and the baseline come from different "
+                        "machines")
+
+    regressions = []
+
+    print("%-40s %-16s %12s %12s %8s" % ("case", "metric", "baseline",
+                                         "value", "change"))
+
+    for name, metrics in report['cases'].items():
+        if name not in baseline['cases']:
+            continue
+
+        for metric, direction in METRICS.items():
+            if metric not in metrics or metric not in baseline['cases'][name]:
+                continue
+
+            old, new = baseline['cases'][name][metric], metrics[metric]
+            worse = direction * (old - new) - SLACK.get(metric, 0.0)
+            change = (new - old) / old if old != 0 else 0.0
+            flag = ""
+
+            if worse > tolerance * abs(old):
+                flag = "REGRESSION"
+                regressions.append((name, metric, old, new))
+
+            print("%-40s %-16s %12.4g %12.4g %+7.1f%% %s"
+                  % (name, metric, old, new, 100 * change, flag))
+
+    missing = set(baseline['cases']) - set(report['cases'])
+
+    for name in sorted(missing):
+        logging.warning("Case %s missing from the report" % (name))
+
+    print("%d regressions over %.0f%%" % (len(regressions), 100 * tolerance))
+
+    return regressions
@@ -0,0 +1,96 @@
+""" @package cache.py
+Provides the eviction of the cached runs.
+
+The runs kept in the storage are a cache of results: a run whose checksum,
+the content hash of its initial states and scheme parameters, matches a
+finished run is served from its snapshots without any computation. Each run
+document records when the run was last used and, once it is done, the size of
+its snapshots, so the least recently used finished runs can be evicted when
+the cache grows over its limits:
+
+    "cache":
+    {
+        "max_runs": <max_runs>,
+        "max_bytes": <max_bytes>
+    }
+
+A limit of 0 is no limit. The runs which are not done are never evicted, so an
+interrupted run can always be restarted.
+"""
+import logging
+
+import time
+
+
+def size(db, checksum):
+    """ Returns the size of a run.
+
+    The size of a run is the size of its potential field and snapshots before
+    compression, i.e. the memory they take once decoded.
+
+    @param db       the database connection,
+    @param checksum the run checksum.
+
+    @return the size of the run, in bytes.
+    """
+    v0 = db.retrieve_run(checksum)['v0']
+    count = sum(1 for _ in db.retrieve_all({"checksum": checksum}, {"t": 1}))
+
+    # psi is the complex counterpart of V0: twice its size.
+    return v0.nbytes * (1 + 2 * count)
+
+
+def touch(db, checksum):
+    """ Marks a run as used.
+
+    @param db       the database connection,
+    @param checksum the run checksum.
+    """
+    db.update_run(checksum, {"used": time.time()})
+
+
+def prune(db, settings = {}, keep = None):
+    """ Evicts the least recently used finished runs.
+
+    The prune() function discards the finished runs of \a db, least recently
+    used first, until there are at most settings.max_runs of them and their
+    total size is at most settings.max_bytes.
+
+    @param db       the database connection,
+    @param settings the cache settings,
+    @param keep     the checksum of a run never evicted.
+
+    @return the checksums of the evicted runs.
+    """
+    max_runs  = settings.get('max_runs', 0)
+    max_bytes = settings.get('max_bytes', 0)
+
+    if max_runs <= 0 and max_bytes <= 0:
+        return []
+
+    runs = sorted((run for run in db.retrieve_runs()
+                   if run.get('status') == "done"),
+                  key = lambda run: run.get('used', 0))
+    count = len(runs)
+    total = sum(run.get('bytes', 0) for run in runs)
+    evicted = []
+
+    for run in runs:
+        if (max_runs <= 0 or count <= max_runs) \
+           and (max_bytes <= 0 or total <= max_bytes):
+            break
+
+        if run['checksum'] == keep:
+            continue
+
+        db.discard(run['checksum'])
+        evicted.append(run['checksum'])
+
+        count = count - 1
+        total = total - run.get('bytes', 0)
+
+    if len(evicted) > 0:
+        logging.info("Evicted %d cached runs: %d runs, %d bytes left"
+                     % (len(evicted), count, total))
+
+    return evicted
@@ -3,7 +3,8 @@ Provides global constants for the solver.
 """
 import numpy as np
 
-# Those global constants will be used directly by the solver.
+# Those global constants will be used directly by the solver, the grid and time
+# ones are the defaults of the parameters file.
 H_BAR = 1.0
 M = 1.0
 
@@ -16,9 +17,17 @@ Y_MAX = 10
 N_Y   = 101
 
 T_MAX = 10
-DT_FTCS = 0.02 / 800
-DT_BTCS = 0.02 / 40
-DT_CTCS = 0.02 / 4
+
+# Largest growth of the fastest grid mode allowed over T_MAX with the FTCS
+# scheme, used to derive its time step.
+FTCS_GROWTH = 10
+
+# Real and complex types of the fields, by precision of the parameters file.
+TYPES = {
+    # "precision": (real, complex),
+    "double": (np.float64, np.complex128),
+    "single": (np.float32, np.complex64),
+}
 
 # Those specific constants are special values for the wave function available by
 # there name in the configuration file (e.g., 1 / sqrt(2 * pi)).
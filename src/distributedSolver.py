@@ -0,0 +1,478 @@
+""" @package distributedSolver.py
+Provides a solver distributed across processes.
+
+The grid is split in strips of columns, one per worker process. Each worker
+runs its own Solver, from the backend it is given, on its strip extended by
+HALO ghost columns on each side, and keeps its strip in it across the calls to
+compute(). The real and imaginary parts of the whole grid live in shared
+memory: every HALO steps at most, each worker writes there the HALO columns
+its neighbours need, and reads their columns into its ghost columns, through
+views of its solver state, so no array is ever pickled and only the strip
+boundaries go through the shared memory. The columns a worker owns are only
+gathered in the shared memory when the main process reads psi. Columns are
+contiguous in the Fortran-ordered arrays, so each strip is a contiguous block
+of the shared memory.
+
+If a worker fails, then the barriers are aborted, and the main process raises
+an error instead of waiting for it.
+
+Only the FTCS scheme is local enough to be distributed this way: the implicit
+and spectral schemes couple the whole grid at each step.
+"""
+import os
+import signal
+import threading
+
+import multiprocessing
+from multiprocessing import shared_memory
+import multiprocessing.connection
+
+import logging
+
+import numpy as np
+
+import backends
+import numpySolver
+
+
+# Number of ghost columns on each side of a strip, i.e. the number of steps
+# computed between two halo exchanges.
+HALO = 8
+
+# Commands of the workers: stop, compute steps, gather the strips in the shared
+# memory, and load the strips from it.
+STOP, COMPUTE, GATHER, LOAD = range(4)
+
+# Time given to the workers to stop, in seconds.
+JOIN_TIMEOUT = 10
+
+
+def shared_array(shape, name = None):
+    """ Creates or attaches a shared Fortran-ordered array.
+
+    @param shape the array shape,
+    @param name  the shared memory name, None to create it.
+
+    @return the shared memory block and the array.
+    """
+    size = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+
+    if name == None:
+        shm = shared_memory.SharedMemory(create = True, size = size)
+    else:
+        shm = shared_memory.SharedMemory(name = name)
+
+    return shm, np.ndarray(shape, dtype = np.float64, buffer = shm.buf,
+                           order = 'F')
+
+
+def worker(backend, names, shape, first, last, args, threads, start, halo,
+           control):
+    """ Worker process main function.
+
+    The worker waits for a command of the main process on the \a start
+    barrier, runs it, then waits on the \a start barrier again. If it fails,
+    then it aborts both barriers, so no process waits for it.
+
+    @param backend the solver backend,
+    @param names   the shared memory names of V0, the real and imaginary parts,
+    @param shape   the grid shape,
+    @param first   the first column owned,
+    @param last    the column after the last one owned,
+    @param args    the scheme parameters,
+    @param threads the number of threads of the solver,
+    @param start   the barrier shared with the main process,
+    @param halo    the barrier shared by the workers,
+    @param control the shared command and number of steps to compute.
+    """
+    # The main process handles the interruptions, and stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    shms, arrays = zip(*[shared_array(shape, name) for name in names])
+    v0, r, i = arrays
+
+    lo = max(first - HALO, 0)
+    hi = min(last + HALO, shape[1])
+
+    try:
+        Solver = backends.load(backend)
+        solv = Solver(np.array(v0[:, lo:hi], order = 'F'),
+                      np.array(r[:, lo:hi], order = 'F'),
+                      np.array(i[:, lo:hi], order = 'F'), *args)
+        solv.set_threads(threads)
+
+        while True:
+            start.wait()
+            command, n = control[:]
+
+            if command == STOP:
+                break
+
+            if command == LOAD:
+                solv.r_view(True)[:] = r[:, lo:hi]
+                solv.i_view(True)[:] = i[:, lo:hi]
+            elif command == GATHER:
+                r[:, first:last] = solv.r_view()[:, first - lo:last - lo]
+                i[:, first:last] = solv.i_view()[:, first - lo:last - lo]
+
+            while command == COMPUTE and n > 0:
+                k = min(HALO, n)
+
+                for view, shared in ((solv.r_view(), r), (solv.i_view(), i)):
+                    shared[:, first:first + HALO] = \
+                        view[:, first - lo:first - lo + HALO]
+                    shared[:, last - HALO:last] = \
+                        view[:, last - lo - HALO:last - lo]
+
+                halo.wait()
+
+                for view, shared in ((solv.r_view(True), r),
+                                     (solv.i_view(True), i)):
+                    view[:, :first - lo] = shared[:, lo:first]
+                    view[:, last - lo:] = shared[:, last:hi]
+
+                halo.wait()
+
+                solv.compute(k)
+                n = n - k
+
+            start.wait()
+    except BaseException:
+        start.abort()
+        halo.abort()
+        raise
+    finally:
+        # The views of the shared memory must be released before closing it.
+        v0 = r = i = arrays = shared = None
+
+        for shm in shms:
+            shm.close()
+
+
+def watch(workers, barriers, stopping):
+    """ Watchdog thread main function.
+
+    Aborts \a barriers as soon as a worker exits while the workers are not
+    stopping, e.g. if it is killed, so the main process never waits for it.
+
+    @param workers  the worker processes,
+    @param barriers the barriers shared with the workers,
+    @param stopping the event set when the workers are stopped.
+    """
+    multiprocessing.connection.wait([process.sentinel for process in workers])
+
+    if not stopping.is_set():
+        logging.error("A distributed worker exited, exit codes: %s"
+                      % ([process.exitcode for process in workers]))
+
+        for barrier in barriers:
+            barrier.abort()
+
+
+class Solver:
+    """ Solver class.
+
+    The Solver class provides the methods of the native Solver class, for the
+    FTCS scheme, on top of worker processes. The workers are started by the
+    first call to compute(), so set_processes() and set_threads() can be
+    called before.
+
+    psi is gathered in the shared memory by the methods reading it, once
+    after each call to compute(). The strips of the workers are loaded back
+    from the shared memory before the next call to compute() if a writable
+    view has been taken.
+    """
+
+    def __init__(self, v0, r_part, i_part, *args):
+        """ Solver constructor.
+
+        @see numpySolver.Solver.__init__()
+
+        @param self   the object pointer,
+        @param v0     the potentiel field,
+        @param r_part the real part,
+        @param i_part the imaginary part,
+        @param args   the scheme parameters.
+        """
+        if len(args) == 7:
+            # The padded arrays are copied in the shared memory anyway.
+            v0, r_part, i_part = (np.asarray(a)[1:-1, 1:-1]
+                                  for a in (v0, r_part, i_part))
+            args = args[:-1]
+
+        scheme = args[-4]
+
+        if scheme != "ftcs":
+            raise ValueError("Scheme %s can't be distributed" % (scheme))
+
+        self.args = args
+        self.shape = np.shape(v0)
+        self.backend = "native"
+        self.processes = os.cpu_count() or 1
+        self.n_threads = 1
+        self.workers = []
+        self.stopping = threading.Event()
+
+        # Whether the shared memory holds the current psi, and whether it has
+        # been written since the workers loaded it.
+        self.synced = True
+        self.dirty = False
+
+        self.shms, self.arrays = map(list, zip(*[shared_array(self.shape)
+                                                 for _ in range(3)]))
+
+        for array, value in zip(self.arrays, (v0, r_part, i_part)):
+            array[:] = value
+
+
+    def set_backend(self, backend):
+        """ Sets the backend of the workers.
+
+        @param self    the object pointer,
+        @param backend the solver backend.
+        """
+        self.backend = backend
+
+
+    def set_processes(self, n):
+        """ Sets the number of worker processes.
+
+        @param self the object pointer,
+        @param n    the number of processes, 0 for one per core.
+        """
+        self.processes = n or os.cpu_count() or 1
+
+
+    def set_threads(self, n):
+        """ Sets the number of threads of each worker.
+
+        @param self the object pointer,
+        @param n    the number of threads, 0 for the OpenMP default.
+        """
+        self.n_threads = n
+
+
+    def threads(self):
+        """ Returns the number of threads.
+
+        @param self the object pointer.
+
+        @return the number of threads of all the workers.
+        """
+        return self.processes * max(self.n_threads, 1)
+
+
+    def start(self):
+        """ Starts the worker processes.
+
+        @param self the object pointer.
+        """
+        processes = max(min(self.processes, self.shape[1] // (2 * HALO)), 1)
+        bounds = np.linspace(0, self.shape[1], processes + 1).astype(int)
+        names = [shm.name for shm in self.shms]
+
+        # The storage client runs threads, which are not safe to fork: the
+        # workers are spawned, and only get picklable arguments.
+        context = multiprocessing.get_context("spawn")
+
+        # The barriers are kept until the workers stop: their semaphores are
+        # removed once collected, maybe before a spawned worker opens them.
+        self.start_barrier = context.Barrier(processes + 1)
+        self.halo_barrier = context.Barrier(processes)
+        self.control = context.Array('l', 2)
+
+        for w in range(processes):
+            process = context.Process(
+                target = worker, daemon = True,
+                args = (self.backend, names, self.shape, bounds[w],
+                        bounds[w + 1], self.args, self.n_threads,
+                        self.start_barrier, self.halo_barrier, self.control))
+            process.start()
+            self.workers.append(process)
+
+        threading.Thread(target = watch, name = "DistributedWatchdog",
+                         daemon = True,
+                         args = (list(self.workers),
+                                 (self.start_barrier, self.halo_barrier),
+                                 self.stopping)).start()
+
+        logging.info("Distributed solver: %d processes of %d threads"
+                     % (processes, max(self.n_threads, 1)))
+
+
+    def command(self, command, n = 0):
+        """ Runs a command on the workers.
+
+        @param self    the object pointer,
+        @param command the command,
+        @param n       the number of time steps, for the COMPUTE command.
+        """
+        if len(self.workers) == 0:
+            self.start()
+
+        self.control[:] = [command, n]
+
+        try:
+            self.start_barrier.wait()
+
+            if command != STOP:
+                self.start_barrier.wait()
+        except threading.BrokenBarrierError as e:
+            for process in self.workers:
+                process.join(JOIN_TIMEOUT)
+
+            raise RuntimeError("A distributed worker failed, exit codes: %s"
+                               % ([process.exitcode
+                                   for process in self.workers])) from e
+
+
+    def sync(self):
+        """ Gathers psi in the shared memory.
+
+        @param self the object pointer.
+        """
+        if not self.synced:
+            self.command(GATHER)
+            self.synced = True
+
+
+    def compute(self, n = 1):
+        """ Computes the next psi values.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        if self.dirty:
+            self.command(LOAD)
+            self.dirty = False
+
+        self.command(COMPUTE, n)
+        self.synced = False
+
+
+    def r_part(self):
+        """ Returns the real part.
+
+        @param self the object pointer.
+
+        @return the current real part.
+        """
+        self.sync()
+
+        return self.arrays[1].copy(order = 'F')
+
+
+    def i_part(self):
+        """ Returns the imaginary part.
+
+        @param self the object pointer.
+
+        @return the current imaginary part.
+        """
+        self.sync()
+
+        return self.arrays[2].copy(order = 'F')
+
+
+    def r_view(self, writable = False):
+        """ Returns a view of the real part.
+
+        The view shares the memory of the workers, so it is only consistent
+        between two calls to compute().
+
+        @param self     the object pointer,
+        @param writable whether the view is writable.
+
+        @return the current real part, without copy.
+        """
+        self.sync()
+        self.dirty = self.dirty or writable
+
+        view = self.arrays[1][:]
+        view.flags.writeable = writable
+
+        return view
+
+
+    def i_view(self, writable = False):
+        """ Returns a view of the imaginary part.
+
+        @see r_view()
+
+        @param self     the object pointer,
+        @param writable whether the view is writable.
+
+        @return the current imaginary part, without copy.
+        """
+        self.sync()
+        self.dirty = self.dirty or writable
+
+        view = self.arrays[2][:]
+        view.flags.writeable = writable
+
+        return view
+
+
+    def observables(self, x_min, y_min):
+        """ Computes the observables of psi.
+
+        The observables are computed from the shared memory by the main
+        process, between two calls to compute().
+
+        @see numpySolver.observables()
+
+        @param self  the object pointer,
+        @param x_min the x coordinate of the first row,
+        @param y_min the y coordinate of the first column.
+
+        @return the norm, the mean position, energy and flux of psi.
+        """
+        self.sync()
+
+        h_bar, m = self.args[:2] if len(self.args) == 6 else (1.0, 1.0)
+        dx, dy = self.args[-3:-1]
+
+        return numpySolver.observables(numpySolver.padded(self.arrays[1]),
+                                       numpySolver.padded(self.arrays[2]),
+                                       self.arrays[0], h_bar, m, dx, dy,
+                                       x_min, y_min)
+
+
+    def close(self):
+        """ Stops the worker processes and frees the shared memory.
+
+        @param self the object pointer.
+        """
+        self.stopping.set()
+
+        if len(self.workers) > 0:
+            if not self.start_barrier.broken:
+                try:
+                    self.command(STOP)
+                except RuntimeError as e:
+                    logging.error(str(e))
+
+            for process in self.workers:
+                process.join(JOIN_TIMEOUT)
+
+                if process.is_alive():
+                    process.terminate()
+
+            self.workers = []
+
+        self.arrays = []
+
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+        self.shms = []
+
+
+    def __del__(self):
+        """ Solver destructor.
+
+        @param self the object pointer.
+        """
+        if len(getattr(self, 'shms', [])) > 0:
+            self.close()
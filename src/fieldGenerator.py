@@ -1,18 +1,18 @@
 """ @package fieldGenerator
 Provides the field generator for the solver.
 
-The fieldGenerator package sets initial states and field for the solver. If the
-previous run has been interrupted, then the field generator will reload it.
+The fieldGenerator package sets initial states and field for the solver. If a
+run with the same content already exists, then the field generator will reload
+it: a finished run is served as it is, and an interrupted one is restarted.
 """
 import json
-import bson
-import pickle
 
 import hashlib
-import gridfs
 
 import logging
 
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -20,7 +20,11 @@ from mongoDBConnection import MongoDBConnection
 import pymongo.errors
 
 from const import *
+import fieldLoader
 import fields
+import grid
+import preview
+import stability
 import waves
 
 
@@ -38,6 +42,42 @@ def hash_content(content):
     return m.hexdigest()
 
 
+def run_checksum(scheme, g, dt, t_max, span, psi, v0):
+    """ Returns the content hash of a run.
+
+    The run_checksum() function hashes the raw bytes of the initial states,
+    with their type and shape, and everything else the snapshots of the run
+    depend on: the scheme, the grid, the time steps and the span. The
+    parameters which only shape the initial states, like the wave or the field
+    names, are covered by the bytes of the states.
+
+    @param scheme the scheme,
+    @param g      the grid,
+    @param dt     the time step,
+    @param t_max  the simulation time,
+    @param span   the span between snapshots,
+    @param psi    the initial psi,
+    @param v0     the potential field.
+
+    @return the SHA-256 of the run, as a human readable hash.
+    """
+    m = hashlib.sha256()
+
+    m.update(json.dumps({"scheme": scheme,
+                         "grid": [g.x_min, g.x_max, g.n_x,
+                                  g.y_min, g.y_max, g.n_y],
+                         "dt": float(dt), "t_max": float(t_max), "span": span,
+                         "h_bar": H_BAR, "m": M},
+                        sort_keys = True).encode("utf-8"))
+
+    for array in (psi, v0):
+        array = np.ascontiguousarray(array)
+        m.update(("%s%s" % (array.dtype.str, array.shape)).encode("utf-8"))
+        m.update(memoryview(array).cast('B'))
+
+    return m.hexdigest()
+
+
 def init_states(config):
     """ Initializes psi and V0
 
@@ -58,46 +98,81 @@ def init_states(config):
 
         i = i + 1
 
+    g = grid.from_config(config)
+
     if config['type'] == "fun":
-        v0 = getattr(fields, config['field'])()
+        v0 = fields.FIELDS[config['field']](grid = g)
+    elif config['type'] == "path":
+        v0 = fieldLoader.load(config['field'], g, **config.get('potential', {}))
     else:
         v0 = getattr(fields, config['field'])
 
-    psi = getattr(waves, config['wave'])(*args)
+    psi = waves.WAVES[config['wave']](*args, grid = g)
 
     return psi, v0
 
 
-def generate(param_file, db):
+def generate(param_file, db, levels = ()):
     """ Puts initial states in database.
 
     The generate() function generates initial states defined in \a param_file
-    and puts it in \a db. If a previous run was interrupted and parameters match
-    with \a param_file, then this function retuns the latest result found in
-    \a db instead.
+    and puts it in \a db. If a run with the same checksum is found in \a db,
+    then nothing is inserted and the run can be restarted from its checkpoint,
+    or served as it is if it is done.
+
+    @see run_checksum()
+    @see preview.pyramid()
 
     @param param_file the parameters file,
-    @param db         the database.
+    @param db         the database,
+    @param levels     the preview levels of the initial snapshot.
 
-    @return true if a previous run can be restarted, false otherwise.
+    @return the run checksum, and true if the run can be restarted.
     """
-    document = db.retrieve()
-
-    if document != None:
-        if document['checksum'] != None:
-            logging.info("Checksum from previous run found")
-            return document['checksum']
-
     with open(param_file, "r") as read_file:
         solver = json.load(read_file)
 
+    precision = solver.get('precision', "double")
+
+    if precision not in TYPES:
+        raise ValueError("Unknown precision: %s" % (precision))
+
+    real, cplx = TYPES[precision]
+
     psi, v0 = init_states(solver)
+    # V0 may be the memory map of a potential file: this is its only copy.
+    psi = psi.astype(cplx)
+    v0  = np.array(v0, dtype = real, order = 'F')
     logging.debug("Initiale states set")
 
-    checksum = (str(solver) + str(psi) + str(v0)).encode("utf-8")
-
-    db.insert({"checksum": hash_content(checksum),
-               "v0": bson.binary.Binary(pickle.dumps(v0, protocol = 2)),
-               "psi": pickle.dumps(psi), "norm": np.linalg.norm(psi),
-               "scheme": solver['scheme'], "t": 0, "span": solver['span']})
+    g     = grid.from_config(solver)
+    t_max = solver.get('t_max', T_MAX)
+    dt    = solver.get('dt', "auto")
+
+    if dt == "auto":
+        dt = stability.time_step(solver['scheme'], g, v0, t_max)
+        logging.info("Time step set to %g" % (dt))
+
+    checksum = run_checksum(solver['scheme'], g, dt, t_max, solver['span'],
+                            psi, v0)
+
+    if db.retrieve_run(checksum) != None:
+        logging.info("Checksum from previous run found")
+        return checksum, True
+
+    # The initial snapshot is inserted before the run document: discard the
+    # snapshots left by an initialisation interrupted in between.
+    db.discard(checksum)
+    db.insert({"checksum": checksum, "t": 0,
+               "psi": db.encode(psi), "norm": float(np.linalg.norm(psi))})
+    db.insert_previews(preview.documents(db, checksum, 0, psi, levels))
+    db.insert_run({"checksum": checksum, "v0": db.encode(v0),
+                   "scheme": solver['scheme'], "span": solver['span'],
+                   "grid": [g.x_min, g.x_max, g.n_x, g.y_min, g.y_max, g.n_y],
+                   "t_max": t_max, "dt": dt, "precision": precision,
+                   "levels": sorted(levels), "checkpoint": 0,
+                   "status": "running",
+                   "used": time.time()})
     logging.info("Initiale states inserted in the DB")
+
+    return checksum, False
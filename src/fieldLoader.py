@@ -0,0 +1,269 @@
+""" @package fieldLoader.py
+Provides the loading of potential fields from files.
+
+A potential field of the "path" type is read from a file:
+
+- .npy files are memory-mapped, so only the rows needed by the grid are read;
+- images (.png, .jpg, .bmp, .tif, ...) are converted to grey levels in [0, 1]
+  with pillow, their first column along x and their bottom row along y;
+- any other file is raw binary, memory-mapped with the given dtype, shape,
+  order and offset.
+
+The values are scaled as shift + scale * value, and resampled to the grid if
+the shapes differ, by blocks of rows so the memory used does not grow with the
+file. The first and last points of the file are the bounds of the grid.
+
+A file which already matches the grid, without scaling, is used as it is: an
+.npy or raw file is not read until the field is converted for the run.
+Otherwise the field computed is cached in a directory, keyed by the hash of the
+file and the grid, so the next runs load it directly. The hash of a file is
+itself indexed by its path, size and modification time, so a file is only
+hashed once. Cache files are written in unique temporary files then renamed,
+so concurrent runs loading the same field never see a partial file.
+"""
+import os
+import tempfile
+
+import hashlib
+
+import json
+
+import logging
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Extensions of the files read as images.
+IMAGES = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+# Resampling methods.
+METHODS = ("linear", "nearest")
+
+# Number of grid rows resampled at once.
+BLOCK = 256
+
+
+def replace(path, write):
+    """ Writes a file atomically.
+
+    The content is written in a unique temporary file of the same directory,
+    then renamed, so concurrent writers never see a partial file.
+
+    @param path  the file path,
+    @param write the function writing the content in a binary file object.
+    """
+    fd, part = tempfile.mkstemp(dir = os.path.dirname(path), suffix = ".part")
+
+    try:
+        with os.fdopen(fd, "wb") as write_file:
+            write(write_file)
+
+        os.replace(part, path)
+    except BaseException:
+        os.remove(part)
+        raise
+
+
+def file_hash(path, cache = None):
+    """ Returns the hash of a file.
+
+    The hash index holds a file per indexed file, so concurrent runs never
+    overwrite the hashes of each other.
+
+    @param path  the file path,
+    @param cache the cache directory holding the hash index, None for no index.
+
+    @return the SHA-256 of the file content, as a human readable hash.
+    """
+    stat = os.stat(path)
+    entry = "%s|%d|%d" % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    index = None
+
+    if cache != None:
+        os.makedirs(os.path.join(cache, "hashes"), exist_ok = True)
+        index = os.path.join(cache, "hashes",
+                             hashlib.sha256(entry.encode("utf-8")).hexdigest())
+
+        if os.path.exists(index):
+            with open(index, "r") as read_file:
+                return read_file.read().strip()
+
+    m = hashlib.sha256()
+
+    with open(path, "rb") as read_file:
+        for chunk in iter(lambda: read_file.read(1 << 20), b""):
+            m.update(chunk)
+
+    if index != None:
+        replace(index, lambda write_file:
+                write_file.write(m.hexdigest().encode("utf-8")))
+
+    return m.hexdigest()
+
+
+def open_file(path, format = "auto", dtype = "float64", shape = None,
+              order = 'C', offset = 0):
+    """ Opens a potential file.
+
+    @param path   the file path,
+    @param format the file format: auto, npy, image or raw,
+    @param dtype  the type of the raw values,
+    @param shape  the shape of the raw values, (x, y),
+    @param order  the memory order of the raw values,
+    @param offset the offset of the raw values, in bytes.
+
+    @return the values, along x then y, memory-mapped unless read as an image.
+    """
+    if format == "auto":
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == ".npy":
+            format = "npy"
+        elif extension in IMAGES:
+            format = "image"
+        else:
+            format = "raw"
+
+    if format == "npy":
+        return np.load(path, mmap_mode = "r")
+
+    if format == "image":
+        if Image == None:
+            raise ImportError("pillow is needed to load %s" % (path))
+
+        with Image.open(path) as image:
+            if image.mode not in ("I;16", "I", "F"):
+                image = image.convert("L")
+
+            values = np.asarray(image)
+
+        if np.issubdtype(values.dtype, np.integer):
+            values = values / np.iinfo(values.dtype).max
+
+        # Rows go down the image: the first column along x is its bottom row.
+        return values[::-1].T
+
+    if format == "raw":
+        if shape == None:
+            raise ValueError("The shape of the raw file %s is missing" % (path))
+
+        return np.memmap(path, dtype = np.dtype(dtype), mode = "r",
+                         offset = offset, shape = tuple(shape), order = order)
+
+    raise ValueError("Unknown potential format: %s" % (format))
+
+
+def resample(values, shape, method = "linear"):
+    """ Resamples values to a shape.
+
+    @param values the values, possibly memory-mapped,
+    @param shape  the new shape,
+    @param method the resampling method, linear or nearest.
+
+    @return the values resampled, in Fortran order.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method: %s" % (method))
+
+    res = np.empty(shape, dtype = np.float64, order = 'F')
+
+    x = np.linspace(0, values.shape[0] - 1, shape[0])
+    y = np.linspace(0, values.shape[1] - 1, shape[1])
+
+    if method == "nearest":
+        ix = np.rint(x).astype(np.intp)
+        iy = np.rint(y).astype(np.intp)
+
+        for first in range(0, shape[0], BLOCK):
+            rows = np.asarray(values[ix[first:first + BLOCK]])
+            res[first:first + BLOCK] = rows[:, iy]
+
+        return res
+
+    x0 = np.minimum(np.floor(x).astype(np.intp), max(values.shape[0] - 2, 0))
+    y0 = np.minimum(np.floor(y).astype(np.intp), max(values.shape[1] - 2, 0))
+    x1 = np.minimum(x0 + 1, values.shape[0] - 1)
+    y1 = np.minimum(y0 + 1, values.shape[1] - 1)
+    fx = (x - x0)[:, np.newaxis]
+    fy = y - y0
+
+    for first in range(0, shape[0], BLOCK):
+        block = slice(first, first + BLOCK)
+
+        lo = np.asarray(values[x0[block]], dtype = np.float64)
+        hi = np.asarray(values[x1[block]], dtype = np.float64)
+        rows = lo + fx[block] * (hi - lo)
+
+        res[block] = rows[:, y0] + fy * (rows[:, y1] - rows[:, y0])
+
+    return res
+
+
+def load(path, grid, format = "auto", dtype = "float64", shape = None,
+         order = 'C', offset = 0, scale = 1.0, shift = 0.0, method = "linear",
+         cache = ".cache/fields"):
+    """ Loads a potential field from a file.
+
+    @see open_file()
+    @see resample()
+
+    @param path   the file path,
+    @param grid   the grid,
+    @param format the file format: auto, npy, image or raw,
+    @param dtype  the type of the raw values,
+    @param shape  the shape of the raw values, (x, y),
+    @param order  the memory order of the raw values,
+    @param offset the offset of the raw values, in bytes,
+    @param scale  the factor applied to the values,
+    @param shift  the value added to the scaled values,
+    @param method the resampling method, linear or nearest,
+    @param cache  the cache directory, None for no cache.
+
+    @return the potential field on the grid: the values of the file if they
+            are used as they are, memory-mapped for .npy and raw files,
+            otherwise a field in Fortran order.
+    """
+    values = open_file(path, format, dtype, shape, order, offset)
+
+    if values.shape == grid.shape and scale == 1 and shift == 0:
+        return values
+
+    name = None
+
+    if cache != None:
+        os.makedirs(cache, exist_ok = True)
+
+        key = json.dumps({"file": file_hash(path, cache),
+                          "grid": [grid.x_min, grid.x_max, grid.n_x,
+                                   grid.y_min, grid.y_max, grid.n_y],
+                          "format": format, "dtype": dtype, "shape": shape,
+                          "order": order, "offset": offset, "scale": scale,
+                          "shift": shift, "method": method},
+                         sort_keys = True)
+        name = os.path.join(cache,
+                            hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+        if os.path.exists(name + ".npy"):
+            logging.info("Potential field %s loaded from the cache" % (path))
+
+            return np.load(name + ".npy", mmap_mode = "r")
+
+    if values.shape != grid.shape:
+        logging.info("Resampling potential field %s from %dx%d to %dx%d"
+                     % ((path,) + values.shape + grid.shape))
+        v0 = resample(values, grid.shape, method)
+    else:
+        v0 = np.array(values, dtype = np.float64, order = 'F')
+
+    v0 *= scale
+    v0 += shift
+
+    if name != None:
+        replace(name + ".npy", lambda write_file: np.save(write_file, v0))
+
+    return v0
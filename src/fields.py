@@ -1,59 +1,101 @@
 """ @package fields.py
 Provides potential field generating functinos for the solver.
+
+Field functions are registered by name in FIELDS. Each one takes the grid to
+compute the field on as keyword argument (the default grid from const.py if
+omitted). Analytic potentials only need to give an expression of the X and Y
+coordinates with the analytic() decorator.
 """
+import functools
+
 import numpy as np
 
+import grid as grd
+
 from const import *
 
 
-def youngs_slits():
+# Field functions available by their name in the configuration file.
+FIELDS = {}
+
+
+def register(fun):
+    """ Registers a field function.
+
+    @param fun the field function.
+
+    @return the field function.
+    """
+    FIELDS[fun.__name__] = fun
+
+    return fun
+
+
+def analytic(expression):
+    """ Registers an analytic potential field.
+
+    The analytic() decorator turns \a expression, a function of the X and Y
+    coordinate arrays of the grid, into a field function.
+
+    @param expression the potential expression.
+
+    @return the field function.
+    """
+    @functools.wraps(expression)
+    def fun(*args, grid = None):
+        if grid == None:
+            grid = grd.get()
+
+        return grid.field(expression(grid.X, grid.Y, *args))
+
+    return register(fun)
+
+
+@register
+def youngs_slits(grid = None):
     """ Returns the potential field for the young's slits simulation.
 
+    @param grid the grid.
+
     @return the initial potential field
     """
-    v0 = np.zeros((N_X, N_Y), dtype = np.float64)
+    if grid == None:
+        grid = grd.get()
 
-    for i in range(N_X):
-        for j in range(N_Y):
-            if j == (N_Y // 2):
-                v0[i, j] = 50
+    v0 = grid.zeros()
 
-    for i in range(N_X):
-        for j in range(N_Y):
-            if i == (N_X // 2):
-                for gap in range(1, 2):
-                    v0[i - gap, j] = v0[i + gap, j] = 0
+    v0[:, grid.n_y // 2] = 50
+    v0[grid.n_x // 2 - 1, grid.n_y // 2] = 0
+    v0[grid.n_x // 2 + 1, grid.n_y // 2] = 0
 
     return v0
 
 
-def barrier():
+@register
+def barrier(grid = None):
     """ Returns the potential field for the barrier simulation.
 
+    @param grid the grid.
+
     @return the initial potential field
     """
-    v0 = np.zeros((N_X, N_Y), dtype = np.float64)
+    if grid == None:
+        grid = grd.get()
 
-    for i in range(N_X):
-        for j in range(N_Y):
-            if j == (N_Y // 2):
-                v0[i, j] = 10
+    v0 = grid.zeros()
+
+    v0[:, grid.n_y // 2] = 10
 
     return v0
 
 
-def potential_2D_HO():
+@analytic
+def potential_2D_HO(X, Y):
     """ Returns the potential field for the 2D H0 simulation.
 
+    @param X the x coordinates,
+    @param Y the y coordinates.
+
     @return the initial potential field
     """
-    X = np.linspace(X_MIN, X_MAX, N_X)
-    Y = np.linspace(Y_MIN, Y_MAX, N_Y)
-
-    v0 = np.zeros((N_X, N_Y), dtype = np.float64)
-
-    for x in range(len(X)):
-        for y in range(len(Y)):
-            v0[x, y] = (1 / 9) * (X[x] ** 2 + Y[y] ** 2)
-
-    return v0
+    return (1 / 9) * (X ** 2 + Y ** 2)
@@ -0,0 +1,150 @@
+""" @package grid.py
+Provides the grid of the solver.
+
+The grid package describes the points of the simulation domain. Waves and fields
+are computed as whole-array expressions of the grid coordinates.
+"""
+import functools
+
+import numpy as np
+
+from const import *
+
+
+class Grid:
+    """ Grid class.
+
+    The Grid class holds the bounds and the number of points of the domain in
+    each direction. Its coordinate arrays are computed once, on first use, and
+    are broadcastable: X has the shape (n_x, 1) and Y the shape (1, n_y), so any
+    expression of X and Y gives a (n_x, n_y) field without building meshgrids.
+    """
+
+    def __init__(self, x_min = X_MIN, x_max = X_MAX, n_x = N_X,
+                       y_min = Y_MIN, y_max = Y_MAX, n_y = N_Y):
+        """ Grid constructor.
+
+        @param self  the object pointer,
+        @param x_min the lower x bound,
+        @param x_max the upper x bound,
+        @param n_x   the number of points along x,
+        @param y_min the lower y bound,
+        @param y_max the upper y bound,
+        @param n_y   the number of points along y.
+        """
+        self.x_min, self.x_max, self.n_x = x_min, x_max, n_x
+        self.y_min, self.y_max, self.n_y = y_min, y_max, n_y
+
+
+    def __repr__(self):
+        """ Returns the grid representation.
+
+        @param self the object pointer.
+
+        @return the grid representation.
+        """
+        return ("Grid(%r, %r, %r, %r, %r, %r)"
+                % (self.x_min, self.x_max, self.n_x,
+                   self.y_min, self.y_max, self.n_y))
+
+
+    @property
+    def shape(self):
+        """ The shape of the fields on the grid. """
+        return (self.n_x, self.n_y)
+
+
+    @property
+    def dx(self):
+        """ The spacing between two points along x. """
+        return (self.x_max - self.x_min) / (self.n_x - 1)
+
+
+    @property
+    def dy(self):
+        """ The spacing between two points along y. """
+        return (self.y_max - self.y_min) / (self.n_y - 1)
+
+
+    @functools.cached_property
+    def X(self):
+        """ The x coordinates, as a (n_x, 1) array. """
+        X = np.linspace(self.x_min, self.x_max, self.n_x)[:, np.newaxis]
+        X.flags.writeable = False
+
+        return X
+
+
+    @functools.cached_property
+    def Y(self):
+        """ The y coordinates, as a (1, n_y) array. """
+        Y = np.linspace(self.y_min, self.y_max, self.n_y)[np.newaxis, :]
+        Y.flags.writeable = False
+
+        return Y
+
+
+    def zeros(self, dtype = np.float64):
+        """ Returns a zero field.
+
+        @param self  the object pointer,
+        @param dtype the field type.
+
+        @return a zero field on the grid, in Fortran order.
+        """
+        return np.zeros(self.shape, dtype = dtype, order = 'F')
+
+
+    def field(self, values, dtype = np.float64):
+        """ Returns a field from an expression of the coordinates.
+
+        The field() method broadcasts \a values, usually an expression of X and
+        Y, to the shape of the grid.
+
+        @param self   the object pointer,
+        @param values the field values,
+        @param dtype  the field type.
+
+        @return the field on the grid, in Fortran order.
+        """
+        res = np.empty(self.shape, dtype = dtype, order = 'F')
+        res[...] = values
+
+        return res
+
+
+@functools.lru_cache(maxsize = None)
+def get(x_min = X_MIN, x_max = X_MAX, n_x = N_X,
+        y_min = Y_MIN, y_max = Y_MAX, n_y = N_Y):
+    """ Returns a shared grid.
+
+    The get() function returns the same Grid object for the same parameters, so
+    its coordinate arrays are only computed once.
+
+    @param x_min the lower x bound,
+    @param x_max the upper x bound,
+    @param n_x   the number of points along x,
+    @param y_min the lower y bound,
+    @param y_max the upper y bound,
+    @param n_y   the number of points along y.
+
+    @return the grid.
+    """
+    return Grid(x_min, x_max, n_x, y_min, y_max, n_y)
+
+
+def from_config(config):
+    """ Returns the grid of a configuration.
+
+    The from_config() function returns the shared grid defined by the x_min,
+    x_max, nx, y_min, y_max and ny keys of \a config. Missing keys default to
+    the constants of const.py.
+
+    @param config the configuration.
+
+    @return the grid.
+    """
+    return get(config.get('x_min', X_MIN), config.get('x_max', X_MAX),
+               config.get('nx', N_X),
+               config.get('y_min', Y_MIN), config.get('y_max', Y_MAX),
+               config.get('ny', N_Y))
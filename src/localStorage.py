@@ -0,0 +1,612 @@
+""" @package localStorage.py
+Provides a local file-backed storage.
+
+The LocalStorage is a drop-in replacement of the MongoDBConnection for runs on
+a single node: snapshots are appended to a memory-mapped time-series file per
+run, and indexed in a SQLite database.
+"""
+import os
+import threading
+
+import json
+import sqlite3
+
+import logging
+
+import numpy as np
+
+import snapshot
+
+
+# Columns of the snapshots which can be filtered, by document key.
+COLUMNS = {"_id": "id", "checksum": "checksum", "t": "t", "norm": "norm"}
+
+# SQL comparisons of the supported filter operators.
+OPERATORS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+class LocalStorage:
+    """ LocalStorage class.
+
+    The LocalStorage class provides the methods of the MongoDBConnection class
+    on top of a local directory. Each run has a frames file, preallocated for
+    the snapshots of the whole run and grown if needed, and an .npy file for its
+    potential field. The psi of a retrieved snapshot is an array document
+    pointing to its frame, which decode() maps without copying it.
+
+    Filters only support equality and the $gt, $gte, $lt and $lte operators on
+    the _id, checksum, t and norm of the snapshots.
+    """
+
+    """ The storage directory of the collection. """
+    path = None
+
+    """ The SQLite index of the collection. """
+    index = None
+
+    """ No GridFS: payloads are never inlined in documents. """
+    fs = None
+
+
+    def __init__(self, path):
+        """ LocalStorage constructor.
+
+        @param self the object pointer,
+        @param path the storage root directory.
+        """
+        self.root = path
+        self.lock = threading.RLock()
+        self.cache = {}
+        self.frames = {}
+        logging.info("Using local storage in %s" % (path))
+
+
+    def use(self, dbname, collection):
+        """ Sets the database and the collection to use.
+
+        The use() method opens the directory \a dbname/\a collection of the
+        storage root, and creates its index if it does not exist.
+
+        @param self       the object pointer,
+        @param dbname     the database name,
+        @param collection a collection of the database.
+        """
+        self.path = os.path.join(self.root, dbname, collection)
+        os.makedirs(self.path, exist_ok = True)
+
+        self.index = sqlite3.connect(os.path.join(self.path, "index.sqlite"),
+                                     check_same_thread = False)
+        self.index.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (checksum TEXT PRIMARY KEY,
+                                             document TEXT);
+            CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY,
+                                                  checksum TEXT, t REAL,
+                                                  norm REAL, slot INTEGER,
+                                                  dtype TEXT, shape TEXT);
+            CREATE INDEX IF NOT EXISTS snapshots_checksum_t
+                ON snapshots (checksum, t);
+            CREATE TABLE IF NOT EXISTS observables (checksum TEXT, t REAL,
+                                                    document TEXT);
+            CREATE INDEX IF NOT EXISTS observables_checksum_t
+                ON observables (checksum, t);
+            CREATE TABLE IF NOT EXISTS previews (checksum TEXT, level INTEGER,
+                                                 t REAL, dtype TEXT,
+                                                 shape TEXT, data BLOB);
+            CREATE INDEX IF NOT EXISTS previews_checksum_level_t
+                ON previews (checksum, level, t);
+        """)
+        self.cache = {}
+        self.frames = {}
+        logging.info("Switched to %s" % (self.path))
+
+
+    def file_name(self, checksum, suffix):
+        """ Returns the path of a run file.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param suffix   the file suffix.
+
+        @return the path of the file.
+        """
+        return os.path.join(self.path, checksum + suffix)
+
+
+    def open_frames(self, checksum, shape, dtype, capacity):
+        """ Opens the frames file of a run.
+
+        The frames file is created with room for \a capacity frames, and grown
+        to twice its capacity when it is full.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param shape    the shape of a frame,
+        @param dtype    the type of a frame,
+        @param capacity the minimum number of frames.
+
+        @return the frames memory map.
+        """
+        if checksum in self.frames:
+            frames = self.frames[checksum]
+
+            if frames.shape[0] >= capacity:
+                return frames
+
+            frames.flush()
+            capacity = max(capacity, 2 * frames.shape[0])
+
+        name = self.file_name(checksum, ".psi")
+        size = capacity * int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        with open(name, "ab") as write_file:
+            if write_file.tell() < size:
+                write_file.truncate(size)
+
+        frames = np.memmap(name, dtype = dtype, mode = "r+",
+                           shape = (capacity,) + tuple(shape))
+        self.frames[checksum] = frames
+
+        return frames
+
+
+    def describe(self, checksum, slot, dtype, shape):
+        """ Returns the array document of a frame.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param slot     the frame index,
+        @param dtype    the type of a frame,
+        @param shape    the shape of a frame.
+
+        @return the array document.
+        """
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        return {"dtype": dtype, "shape": list(shape), "order": 'C',
+                "compression": "none",
+                "file": self.file_name(checksum, ".psi"), "offset": slot * size}
+
+
+    def write(self, data):
+        """ Writes snapshots, without committing them.
+
+        @param self the object pointer,
+        @param data the new documents.
+
+        @return the IDs of the new documents.
+        """
+        data_ids = []
+
+        for document in data:
+            checksum = document['checksum']
+            psi = document['psi']
+
+            slot = self.index.execute(
+                "SELECT COALESCE(MAX(slot) + 1, 0) FROM snapshots "
+                "WHERE checksum = ?", (checksum,)).fetchone()[0]
+
+            run = self.retrieve_run(checksum)
+            capacity = slot + 1
+
+            if run != None:
+                capacity = max(capacity, round(run['t_max'] / run['dt'])
+                                         // run['span'] + 2)
+
+            frames = self.open_frames(checksum, psi.shape, psi.dtype, capacity)
+            frames[slot] = psi
+
+            cursor = self.index.execute(
+                "INSERT INTO snapshots (checksum, t, norm, slot, dtype, shape) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (checksum, float(document['t']), float(document['norm']), slot,
+                 frames.dtype.str, json.dumps(psi.shape)))
+            data_ids.append(cursor.lastrowid)
+
+        return data_ids
+
+
+    def commit(self, j = False):
+        """ Commits the pending writes.
+
+        @param self the object pointer,
+        @param j    whether the frames are flushed to the disk first.
+        """
+        if j:
+            for frames in self.frames.values():
+                frames.flush()
+
+        self.index.commit()
+
+
+    def insert(self, data):
+        """ Insterts a new document.
+
+        @param self the object pointer,
+        @param data the new document.
+
+        @return the ID of the new document.
+        """
+        return self.insert_many([data])[0]
+
+
+    def insert_many(self, data, w = 1, j = False):
+        """ Insterts new documents.
+
+        The insert_many() method inserts the new documents \a data in a single
+        transaction. The write concern \a w is meaningless on a single node.
+
+        @param self the object pointer,
+        @param data the new documents,
+        @param w    the number of nodes acknowledging the write,
+        @param j    whether the frames are flushed to the disk first.
+
+        @return the IDs of the new documents.
+        """
+        with self.lock:
+            data_ids = self.write(data)
+            self.commit(j)
+
+        logging.debug("Inserted %d documents" % (len(data_ids)))
+
+        return data_ids
+
+
+    def insert_run(self, data):
+        """ Insterts the metadata of a run.
+
+        @param self the object pointer,
+        @param data the run document.
+
+        @return the run checksum.
+        """
+        data = dict(data)
+        v0 = data.pop('v0')
+
+        np.save(self.file_name(data['checksum'], ".v0.npy"), v0)
+
+        with self.lock:
+            self.index.execute("INSERT INTO runs VALUES (?, ?)",
+                               (data['checksum'], json.dumps(data)))
+            self.index.commit()
+
+        logging.debug("Inserted run %s" % (data['checksum']))
+
+        return data['checksum']
+
+
+    def retrieve_run(self, checksum):
+        """ Retrieves the metadata of a run.
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the run document retrieved.
+        """
+        if checksum in self.cache:
+            return self.cache[checksum]
+
+        with self.lock:
+            row = self.index.execute("SELECT document FROM runs "
+                                     "WHERE checksum = ?", (checksum,)).fetchone()
+
+        if row == None:
+            return None
+
+        document = json.loads(row[0])
+        document['v0'] = np.load(self.file_name(checksum, ".v0.npy"),
+                                 mmap_mode = "r")
+        self.cache[checksum] = document
+
+        return document
+
+
+    def retrieve_runs(self):
+        """ Retrieves the metadata of all the runs.
+
+        @see MongoDBConnection.retrieve_runs()
+
+        @param self the object pointer.
+
+        @return the run documents retrieved, without their potential field.
+        """
+        with self.lock:
+            rows = self.index.execute("SELECT document FROM runs").fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+
+    def update_run(self, checksum, data, w = 1, j = False):
+        """ Updates the metadata of a run.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param data     the fields to update,
+        @param w        the number of nodes acknowledging the write,
+        @param j        whether the frames are flushed to the disk first.
+        """
+        with self.lock:
+            row = self.index.execute("SELECT document FROM runs "
+                                     "WHERE checksum = ?", (checksum,)).fetchone()
+
+            if row == None:
+                return
+
+            document = json.loads(row[0])
+            document.update(data)
+
+            self.index.execute("UPDATE runs SET document = ? WHERE checksum = ?",
+                               (json.dumps(document), checksum))
+            self.commit(j)
+
+        if checksum in self.cache:
+            self.cache[checksum].update(data)
+
+
+    def insert_observables(self, data):
+        """ Insterts observables of a run.
+
+        @see MongoDBConnection.insert_observables()
+
+        @param self the object pointer,
+        @param data the observables documents.
+
+        @return the IDs of the new documents.
+        """
+        with self.lock:
+            data_ids = [self.index.execute(
+                            "INSERT INTO observables VALUES (?, ?, ?)",
+                            (document['checksum'], float(document['t']),
+                             json.dumps(document))).lastrowid
+                        for document in data]
+            self.index.commit()
+
+        logging.debug("Inserted %d observables" % (len(data_ids)))
+
+        return data_ids
+
+
+    def retrieve_observables(self, checksum):
+        """ Retrieves the observables of a run.
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the observables documents, in time order.
+        """
+        with self.lock:
+            rows = self.index.execute("SELECT document FROM observables "
+                                      "WHERE checksum = ? ORDER BY t",
+                                      (checksum,)).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+
+    def insert_previews(self, data):
+        """ Insterts previews of snapshots.
+
+        Previews are small, so their arrays are stored in the index.
+
+        @see MongoDBConnection.insert_previews()
+
+        @param self the object pointer,
+        @param data the preview documents.
+
+        @return the IDs of the new documents.
+        """
+        data_ids = []
+
+        with self.lock:
+            for document in data:
+                modulus = np.ascontiguousarray(document['modulus'])
+                cursor = self.index.execute(
+                    "INSERT INTO previews VALUES (?, ?, ?, ?, ?, ?)",
+                    (document['checksum'], document['level'],
+                     float(document['t']), modulus.dtype.str,
+                     json.dumps(modulus.shape), modulus.tobytes()))
+                data_ids.append(cursor.lastrowid)
+
+            self.index.commit()
+
+        logging.debug("Inserted %d previews" % (len(data_ids)))
+
+        return data_ids
+
+
+    def retrieve_previews(self, checksum, level, t_min = None, t_max = None):
+        """ Retrieves the previews of a run over a time range.
+
+        @see MongoDBConnection.retrieve_previews()
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param level    the preview level,
+        @param t_min    the first time, None for no lower bound,
+        @param t_max    the last time, None for no upper bound.
+
+        @return the preview documents, in time order.
+        """
+        query = ("SELECT t, dtype, shape, data FROM previews "
+                 "WHERE checksum = ? AND level = ?")
+        args = [checksum, level]
+
+        if t_min != None:
+            query += " AND t >= ?"
+            args.append(float(t_min))
+
+        if t_max != None:
+            query += " AND t <= ?"
+            args.append(float(t_max))
+
+        with self.lock:
+            rows = self.index.execute(query + " ORDER BY t", args).fetchall()
+
+        return [{"checksum": checksum, "t": t, "level": level,
+                 "modulus": np.frombuffer(data, dtype = np.dtype(dtype))
+                              .reshape(json.loads(shape))}
+                for t, dtype, shape, data in rows]
+
+
+    def retrieve_checkpoint(self, checksum):
+        """ Retrieves the last checkpoint of a run.
+
+        @see MongoDBConnection.retrieve_checkpoint()
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the checkpoint snapshot.
+        """
+        run = self.retrieve_run(checksum)
+
+        if run == None:
+            return None
+
+        self.discard(checksum, run['checkpoint'])
+
+        return self.retrieve({"checksum": checksum, "t": run['checkpoint']})
+
+
+    def discard(self, checksum, t = None):
+        """ Discards the snapshots of a run.
+
+        The discard() method removes the snapshots, the observables and the
+        previews of \a checksum after the time \a t. If no time is specified,
+        then the whole run is removed, its files included.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param t        the time after which snapshots are discarded.
+        """
+        with self.lock:
+            if t != None:
+                for table in ("snapshots", "observables", "previews"):
+                    self.index.execute("DELETE FROM %s "
+                                       "WHERE checksum = ? AND t > ?" % (table),
+                                       (checksum, float(t)))
+            else:
+                for table in ("snapshots", "observables", "previews"):
+                    self.index.execute("DELETE FROM %s WHERE checksum = ?"
+                                       % (table), (checksum,))
+                self.index.execute("DELETE FROM runs WHERE checksum = ?",
+                                   (checksum,))
+                self.cache.pop(checksum, None)
+                self.frames.pop(checksum, None)
+
+                for suffix in (".psi", ".v0.npy"):
+                    if os.path.exists(self.file_name(checksum, suffix)):
+                        os.remove(self.file_name(checksum, suffix))
+
+            self.index.commit()
+
+        logging.debug("Discarded documents of run %s" % (checksum))
+
+
+    def find(self, data, limit = None):
+        """ Finds the snapshots matching a filter, latest first.
+
+        @param self  the object pointer,
+        @param data  the filter,
+        @param limit the maximum number of snapshots.
+
+        @return the snapshots found.
+        """
+        query = "SELECT id, checksum, t, norm, slot, dtype, shape FROM snapshots"
+        where, args = [], []
+
+        for key, value in (data or {}).items():
+            if key not in COLUMNS:
+                raise ValueError("Unsupported filter key: %s" % (key))
+
+            if not isinstance(value, dict):
+                value = {None: value}
+
+            for operator, operand in value.items():
+                if operator == None:
+                    where.append("%s = ?" % (COLUMNS[key]))
+                elif operator in OPERATORS:
+                    where.append("%s %s ?" % (COLUMNS[key], OPERATORS[operator]))
+                else:
+                    raise ValueError("Unsupported filter operator: %s"
+                                     % (operator))
+
+                args.append(operand)
+
+        if len(where) > 0:
+            query += " WHERE " + " AND ".join(where)
+
+        query += " ORDER BY id DESC"
+
+        if limit != None:
+            query += " LIMIT %d" % (limit)
+
+        with self.lock:
+            rows = self.index.execute(query, args).fetchall()
+
+        documents = []
+
+        for data_id, checksum, t, norm, slot, dtype, shape in rows:
+            psi = self.describe(checksum, slot, dtype, json.loads(shape))
+            documents.append({"_id": data_id, "checksum": checksum, "t": t,
+                              "norm": norm, "psi": psi})
+
+        return documents
+
+
+    def retrieve(self, data = None):
+        """ Retrieves a document.
+
+        The retrieve() method retrieves the last inserted snapshot that matchs
+        \a data filter.
+
+        @param self the object pointer,
+        @param data the parameters for retrievement.
+
+        @return the document retrieved.
+        """
+        documents = self.find(data, 1)
+
+        if len(documents) == 0:
+            return None
+
+        return documents[0]
+
+
+    def retrieve_all(self, data = None, projection = None):
+        """ Retrieves all documents.
+
+        @param self       the object pointer,
+        @param data       the parameters for retrievement,
+        @param projection ignored, psi is never read before it is decoded.
+
+        @return all documents retrieved.
+        """
+        return reversed(self.find(data))
+
+
+    def encode(self, array):
+        """ Encodes an array for storage.
+
+        Arrays are written as they are by the insertion methods.
+
+        @param self  the object pointer,
+        @param array the array.
+
+        @return the array.
+        """
+        return array
+
+
+    def decode(self, document):
+        """ Decodes a stored array.
+
+        @see snapshot.decode()
+
+        @param self     the object pointer,
+        @param document the array document.
+
+        @return the array, a read-only view of its file.
+        """
+        if isinstance(document, np.ndarray):
+            return document
+
+        return snapshot.decode(document)
@@ -0,0 +1,309 @@
+""" @package metrics.py
+Provides the instrumentation of a run.
+
+The metrics of a run are the time spent in each phase of the compute loop and of
+the snapshot writer, a few counters (e.g., the bytes written) and gauges (e.g.,
+the depth of the snapshot queue), and the progress of the run. They are emitted
+periodically to the log and, if an output file is set, as JSON lines or as a
+Prometheus textfile.
+
+An opt-in cProfile hook covers a bounded window of time steps.
+"""
+import os
+import io
+import threading
+import contextlib
+
+import cProfile
+import pstats
+
+import json
+
+import logging
+
+import time
+
+
+class Metrics:
+    """ Metrics class.
+
+    The Metrics class accumulates the phase timers and the counters of a run.
+    The timers are cheap enough to wrap each call of the compute loop, and can
+    be updated from any thread.
+    """
+
+    """ Output formats. """
+    FORMATS = ("jsonl", "prometheus")
+
+
+    def __init__(self, output = None, interval = 10, format = "jsonl",
+                 total = 0, dt = 0):
+        """ Metrics constructor.
+
+        @param self     the object pointer,
+        @param output   the metrics file, appended to, None to only log them,
+        @param interval the minimum time between two emissions, in seconds,
+        @param format   the metrics file format, jsonl or prometheus,
+        @param total    the number of steps to compute,
+        @param dt       the time step.
+        """
+        if format not in self.FORMATS:
+            raise ValueError("Unknown metrics format: %s" % (format))
+
+        self.output = output
+        self.interval = interval
+        self.format = format
+        self.total, self.dt = total, dt
+
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.gauges = {}
+        self.steps = 0
+        self.step = 0
+
+        self.begin = time.perf_counter()
+        self.last = self.begin
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Times a phase.
+
+        @param self the object pointer,
+        @param name the phase name.
+        """
+        begin = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - begin)
+
+
+    def add(self, name, elapsed):
+        """ Adds a time to a phase.
+
+        @param self    the object pointer,
+        @param name    the phase name,
+        @param elapsed the time spent, in seconds.
+        """
+        with self.lock:
+            total, count = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + elapsed, count + 1)
+
+
+    def count(self, name, value = 1):
+        """ Increments a counter.
+
+        @param self  the object pointer,
+        @param name  the counter name,
+        @param value the increment.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def gauge(self, name, value):
+        """ Sets a gauge.
+
+        @param self  the object pointer,
+        @param name  the gauge name,
+        @param value the current value.
+        """
+        self.gauges[name] = value
+
+
+    def progress(self, step, steps):
+        """ Records the progress of the run.
+
+        @param self  the object pointer,
+        @param step  the current time step,
+        @param steps the number of steps computed by this run.
+        """
+        self.step, self.steps = step, steps
+
+
+    def snapshot(self):
+        """ Returns the current metrics.
+
+        The ETA is the time to compute the remaining steps to t_max at the
+        average speed of the run so far.
+
+        @param self the object pointer.
+
+        @return the metrics document.
+        """
+        elapsed = time.perf_counter() - self.begin
+        rate = self.steps / elapsed if elapsed > 0 else 0.0
+        eta = None
+
+        if rate > 0:
+            eta = (self.total - self.steps) / rate
+
+        with self.lock:
+            phases = {name: {"time": total, "count": count}
+                      for name, (total, count) in self.phases.items()}
+            counters = dict(self.counters)
+
+        return {"time": time.time(), "elapsed": elapsed, "step": self.step,
+                "t": self.step * self.dt, "steps": self.steps,
+                "total": self.total, "steps_per_second": rate, "eta": eta,
+                "phases": phases, "counters": counters,
+                "gauges": dict(self.gauges)}
+
+
+    def report(self, force = False):
+        """ Emits the metrics if the interval is over.
+
+        @param self  the object pointer,
+        @param force whether the metrics are emitted anyway.
+        """
+        now = time.perf_counter()
+
+        if not force and now - self.last < self.interval:
+            return
+
+        self.last = now
+        document = self.snapshot()
+
+        phases = ", ".join("%s %.3fs" % (name, value['time'])
+                           for name, value in document['phases'].items())
+        eta = document['eta']
+
+        logging.info("Step %d/%d, %.1f steps/s, ETA %s, %d bytes written, "
+                     "queue %d; %s"
+                     % (document['steps'], document['total'],
+                        document['steps_per_second'],
+                        "%.1fs" % (eta) if eta != None else "unknown",
+                        document['counters'].get('bytes', 0),
+                        document['gauges'].get('queue', 0), phases))
+
+        if self.output == None:
+            return
+
+        if self.format == "jsonl":
+            with open(self.output, "a") as write_file:
+                write_file.write(json.dumps(document) + "\n")
+        else:
+            self.write_prometheus(document)
+
+
+    def write_prometheus(self, document):
+        """ Writes the metrics as a Prometheus textfile.
+
+        The file is written in a temporary file, then renamed, so the exporter
+        never reads a partial file.
+
+        @param self     the object pointer,
+        @param document the metrics document.
+        """
+        lines = [
+            "solver_step %d" % (document['step']),
+            "solver_steps_total %d" % (document['steps']),
+            "solver_steps_target %d" % (document['total']),
+            "solver_steps_per_second %g" % (document['steps_per_second']),
+        ]
+
+        if document['eta'] != None:
+            lines.append("solver_eta_seconds %g" % (document['eta']))
+
+        for name, value in document['phases'].items():
+            lines.append('solver_phase_seconds_total{phase="%s"} %g'
+                         % (name, value['time']))
+            lines.append('solver_phase_calls_total{phase="%s"} %d'
+                         % (name, value['count']))
+
+        for name, value in document['counters'].items():
+            lines.append("solver_%s_total %g" % (name, value))
+
+        for name, value in document['gauges'].items():
+            lines.append("solver_%s %g" % (name, value))
+
+        with open(self.output + ".part", "w") as write_file:
+            write_file.write("\n".join(lines) + "\n")
+
+        os.replace(self.output + ".part", self.output)
+
+
+class Profiler:
+    """ Profiler class.
+
+    The Profiler class runs cProfile over a bounded window of time steps of a
+    run, then writes its statistics and logs the most expensive functions.
+    """
+
+    def __init__(self, start = 0, steps = 0, output = "profile.prof", top = 20):
+        """ Profiler constructor.
+
+        @param self   the object pointer,
+        @param start  the first step of the window, counted from the run start,
+        @param steps  the number of steps of the window, 0 to disable it,
+        @param output the statistics file,
+        @param top    the number of functions logged.
+        """
+        self.start, self.end = start, start + steps
+        self.output = output
+        self.top = top
+        self.profile = None
+        self.done = steps <= 0
+
+
+    def limit(self, count):
+        """ Returns the number of steps until the next edge of the window.
+
+        @param self  the object pointer,
+        @param count the number of steps computed.
+
+        @return the number of steps to compute before the next edge.
+        """
+        if self.done:
+            return float("inf")
+
+        if count < self.start:
+            return self.start - count
+
+        return self.end - count
+
+
+    def before(self, count):
+        """ Starts the profiler at the beginning of the window.
+
+        @param self  the object pointer,
+        @param count the number of steps computed.
+        """
+        if not self.done and self.profile == None and count >= self.start:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            logging.info("Profiling steps %d to %d" % (self.start, self.end))
+
+
+    def after(self, count):
+        """ Stops the profiler at the end of the window.
+
+        @param self  the object pointer,
+        @param count the number of steps computed.
+        """
+        if self.profile != None and count >= self.end:
+            self.close()
+
+
+    def close(self):
+        """ Stops the profiler and writes its statistics.
+
+        @param self the object pointer.
+        """
+        if self.profile == None:
+            return
+
+        self.profile.disable()
+        self.profile.dump_stats(self.output)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream = stream)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        logging.info("Profile written in %s\n%s"
+                     % (self.output, stream.getvalue()))
+
+        self.profile = None
+        self.done = True
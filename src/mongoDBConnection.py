@@ -5,12 +5,16 @@ The MongoDBconnection is an interface that provides simple utilities to
 interact with a MongoDB database.
 """
 from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
 import pymongo.errors
 
 from bson.objectid import ObjectId
+import gridfs
 
 import logging
 
+import snapshot
+
 
 class MongoDBConnection:
     """ MongoDBConnection class.
@@ -29,18 +33,36 @@ class MongoDBConnection:
     """ The MongoDB client collection. """
     collection = None
 
+    """ The MongoDB collection of the runs metadata. """
+    runs = None
+
+    """ The MongoDB collection of the observables time series. """
+    observables = None
+
+    """ The MongoDB collection of the snapshot previews. """
+    previews = None
+
+    """ The GridFS instance of the database, for big arrays. """
+    fs = None
+
+    """ The compression of the stored arrays. """
+    compression = "none"
+
 
-    def __init__(self, host, username, password, dbname):
+    def __init__(self, host, username, password, dbname, compression = "none"):
         """ MongoDBConnection constructor.
 
         The MongDBConnection constructor creates a connection to MongoDB.
 
-        @param self     the object pointer,
-        @param host     the MongoDB host,
-        @param username the user login,
-        @param password the user password,
-        @param dbname   the MongoDB database.
+        @param self        the object pointer,
+        @param host        the MongoDB host,
+        @param username    the user login,
+        @param password    the user password,
+        @param dbname      the MongoDB database,
+        @param compression the compression of the stored arrays.
         """
+        self.compression = compression
+        self.cache  = {}
         self.client = MongoClient("mongodb://%s:%s@%s/%s"
                                   % (username, password, host, dbname))
         logging.info("Connected to mongodb://%s:%s@%s/%s"
@@ -51,7 +73,9 @@ class MongoDBConnection:
         """ Sets the database and the collection to use.
 
         The use() method sets the database \a dbname and the collection
-        \a collection to use for MongoDB transactions.
+        \a collection to use for MongoDB transactions, and creates the indexes
+        of the snapshots, runs, observables and previews collections if they do
+        not exist.
 
         @param self       the object pointer,
         @param dbname     the database name,
@@ -60,6 +84,19 @@ class MongoDBConnection:
         try:
             self.db = self.client[dbname]
             self.collection = self.db[collection]
+            self.runs = self.db[collection + ".runs"]
+            self.observables = self.db[collection + ".observables"]
+            self.previews = self.db[collection + ".previews"]
+            self.fs = gridfs.GridFS(self.db, collection)
+            self.cache = {}
+            self.collection.create_index([("checksum", pymongo.ASCENDING),
+                                          ("t", pymongo.ASCENDING)])
+            self.runs.create_index("checksum", unique = True)
+            self.observables.create_index([("checksum", pymongo.ASCENDING),
+                                           ("t", pymongo.ASCENDING)])
+            self.previews.create_index([("checksum", pymongo.ASCENDING),
+                                        ("level", pymongo.ASCENDING),
+                                        ("t", pymongo.ASCENDING)])
             logging.info("Switched to DB %s collection %s"
                          % (self.db.name, self.collection.name))
         except pymongo.errors.OperationFailure as e:
@@ -92,6 +129,332 @@ class MongoDBConnection:
         return data_id
 
 
+    def insert_many(self, data, w = 1, j = False):
+        """ Insterts new documents.
+
+        The insert_many() method inserts the new documents \a data in the
+        current collection set by the use() method, in a single bulk write
+        acknowledged with the write concern \a w and \a j.
+
+        @see use()
+
+        @param self the object pointer,
+        @param data the new documents,
+        @param w    the number of nodes acknowledging the write,
+        @param j    whether the write is acknowledged once journaled.
+
+        @return the IDs of the new documents.
+        """
+        data_ids = []
+
+        if len(data) == 0:
+            return data_ids
+
+        try:
+            collection = self.collection.with_options(
+                write_concern = WriteConcern(w = w, j = j))
+            data_ids = collection.insert_many(data).inserted_ids
+            logging.debug("Inserted %d documents" % (len(data_ids)))
+            self.last = data_ids[-1]
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Insertion failed: %s" % (str(e)))
+
+        return data_ids
+
+
+    def insert_run(self, data):
+        """ Insterts the metadata of a run.
+
+        The insert_run() method inserts the run document \a data in the runs
+        collection associated with the collection set by the use() method. The
+        run document holds everything that does not change during the run, so
+        snapshot documents only hold what does.
+
+        @see use()
+
+        @param self the object pointer,
+        @param data the run document.
+
+        @return the ID of the run document.
+        """
+        data_id = None
+
+        try:
+            data_id = self.runs.insert_one(data).inserted_id
+            logging.debug("Inserted run %s" % (str(data['checksum'])))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Insertion failed: %s" % (str(e)))
+
+        return data_id
+
+
+    def retrieve_run(self, checksum):
+        """ Retrieves the metadata of a run.
+
+        The retrieve_run() method retrieves the run document of \a checksum,
+        with its potential field decoded. Run documents are cached, so the
+        potential field is only read once per run.
+
+        @see insert_run()
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the run document retrieved.
+        """
+        if checksum in self.cache:
+            return self.cache[checksum]
+
+        document = None
+
+        try:
+            document = self.runs.find_one({"checksum": checksum})
+
+            if document != None:
+                document['v0'] = self.decode(document['v0'])
+                self.cache[checksum] = document
+                logging.debug("Retrieved run %s" % (str(checksum)))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Retrieve failed: %s" % (str(e)))
+
+        return document
+
+
+    def retrieve_runs(self):
+        """ Retrieves the metadata of all the runs.
+
+        The retrieve_runs() method retrieves the run documents of the
+        collection set by the use() method, without their potential field.
+
+        @see insert_run()
+
+        @param self the object pointer.
+
+        @return the run documents retrieved.
+        """
+        documents = []
+
+        try:
+            documents = list(self.runs.find({}, {"_id": 0, "v0": 0}))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Retrieve failed: %s" % (str(e)))
+
+        return documents
+
+
+    def update_run(self, checksum, data, w = 1, j = False):
+        """ Updates the metadata of a run.
+
+        @see insert_run()
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param data     the fields to update,
+        @param w        the number of nodes acknowledging the write,
+        @param j        whether the write is acknowledged once journaled.
+        """
+        try:
+            runs = self.runs.with_options(
+                write_concern = WriteConcern(w = w, j = j))
+            runs.update_one({"checksum": checksum}, {"$set": data})
+            logging.debug("Updated run %s" % (str(checksum)))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Update failed: %s" % (str(e)))
+
+        if checksum in self.cache:
+            self.cache[checksum].update(data)
+
+
+    def insert_observables(self, data):
+        """ Insterts observables of a run.
+
+        The insert_observables() method inserts the observables documents
+        \a data, each one holding the checksum of its run, its time and the
+        values of its observables, in the observables collection associated
+        with the collection set by the use() method.
+
+        @see use()
+
+        @param self the object pointer,
+        @param data the observables documents.
+
+        @return the IDs of the new documents.
+        """
+        data_ids = []
+
+        if len(data) == 0:
+            return data_ids
+
+        try:
+            data_ids = self.observables.insert_many(data).inserted_ids
+            logging.debug("Inserted %d observables" % (len(data_ids)))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Insertion failed: %s" % (str(e)))
+
+        return data_ids
+
+
+    def retrieve_observables(self, checksum):
+        """ Retrieves the observables of a run.
+
+        @see insert_observables()
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the observables documents, in time order.
+        """
+        documents = []
+
+        try:
+            documents = list(self.observables.find({"checksum": checksum},
+                                                   {"_id": 0})
+                                             .sort("t", pymongo.ASCENDING))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Retrieve failed: %s" % (str(e)))
+
+        return documents
+
+
+    def insert_previews(self, data):
+        """ Insterts previews of snapshots.
+
+        The insert_previews() method inserts the preview documents \a data,
+        each one holding the checksum of its run, its time, its level and its
+        encoded array, in the previews collection associated with the
+        collection set by the use() method.
+
+        @see use()
+        @see preview.pyramid()
+
+        @param self the object pointer,
+        @param data the preview documents.
+
+        @return the IDs of the new documents.
+        """
+        data_ids = []
+
+        if len(data) == 0:
+            return data_ids
+
+        try:
+            data_ids = self.previews.insert_many(data).inserted_ids
+            logging.debug("Inserted %d previews" % (len(data_ids)))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Insertion failed: %s" % (str(e)))
+
+        return data_ids
+
+
+    def retrieve_previews(self, checksum, level, t_min = None, t_max = None):
+        """ Retrieves the previews of a run over a time range.
+
+        The retrieve_previews() method retrieves the previews of \a checksum
+        at \a level between the times \a t_min and \a t_max included,
+        through the (checksum, level, t) index.
+
+        @see insert_previews()
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param level    the preview level,
+        @param t_min    the first time, None for no lower bound,
+        @param t_max    the last time, None for no upper bound.
+
+        @return the preview documents, with their array decoded, in time order.
+        """
+        data = {"checksum": checksum, "level": level}
+        documents = []
+
+        if t_min != None or t_max != None:
+            data['t'] = {}
+
+            if t_min != None:
+                data['t']['$gte'] = t_min
+
+            if t_max != None:
+                data['t']['$lte'] = t_max
+
+        try:
+            documents = list(self.previews.find(data, {"_id": 0})
+                                          .sort("t", pymongo.ASCENDING))
+
+            for document in documents:
+                document['modulus'] = self.decode(document['modulus'])
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Retrieve failed: %s" % (str(e)))
+
+        return documents
+
+
+    def retrieve_checkpoint(self, checksum):
+        """ Retrieves the last checkpoint of a run.
+
+        The retrieve_checkpoint() method retrieves the snapshot at the time of
+        the checkpoint recorded in the run document of \a checksum, through the
+        (checksum, t) index. The snapshots written after the checkpoint were
+        never acknowledged as a whole, so they are discarded.
+
+        @see discard()
+
+        @param self     the object pointer,
+        @param checksum the run checksum.
+
+        @return the checkpoint snapshot.
+        """
+        run = self.retrieve_run(checksum)
+
+        if run == None:
+            return None
+
+        self.discard(checksum, run['checkpoint'])
+
+        return self.retrieve({"checksum": checksum, "t": run['checkpoint']})
+
+
+    def discard(self, checksum, t = None):
+        """ Discards the snapshots of a run.
+
+        The discard() method removes the snapshots of \a checksum after the
+        time \a t, their observables and their previews, GridFS payloads
+        included. If no time is specified, then the whole run is removed, its
+        run document included.
+
+        @param self     the object pointer,
+        @param checksum the run checksum,
+        @param t        the time after which snapshots are discarded.
+        """
+        data = {"checksum": checksum}
+
+        if t != None:
+            data['t'] = {"$gt": t}
+
+        try:
+            for document in self.collection.find(data, {"psi.gridfs": 1}):
+                if 'gridfs' in document.get('psi', {}):
+                    self.fs.delete(document['psi']['gridfs'])
+
+            for document in self.previews.find(data, {"modulus.gridfs": 1}):
+                if 'gridfs' in document.get('modulus', {}):
+                    self.fs.delete(document['modulus']['gridfs'])
+
+            count = self.collection.delete_many(data).deleted_count
+            self.observables.delete_many(data)
+            self.previews.delete_many(data)
+
+            if t == None:
+                run = self.runs.find_one_and_delete({"checksum": checksum})
+                self.cache.pop(checksum, None)
+
+                if run != None and 'gridfs' in run['v0']:
+                    self.fs.delete(run['v0']['gridfs'])
+
+            logging.debug("Discarded %d documents of run %s"
+                          % (count, str(checksum)))
+        except pymongo.errors.OperationFailure as e:
+            logging.error("Discard failed: %s" % (str(e)))
+
+
     def retrieve(self, data = None):
         """ Retrieves a document.
 
@@ -126,15 +489,18 @@ class MongoDBConnection:
         return document
 
 
-    def retrieve_all(self, data = None):
+    def retrieve_all(self, data = None, projection = None):
         """ Retrieves all documents.
 
         The retrieve_all() methode retrieves all documents in the current
-        collection set by the use() method.
+        collection set by the use() method. If \a projection is specified, then
+        only the fields it selects are retrieved.
 
         @see use()
 
-        @param self the object pointer.
+        @param self       the object pointer,
+        @param data       the parameters for retrievement,
+        @param projection the fields to retrieve.
 
         @return all documents retrieved.
         """
@@ -142,12 +508,41 @@ class MongoDBConnection:
 
         try:
             if data == None:
-                documents = self.collection.find()
+                documents = self.collection.find(projection = projection)
             else:
-                documents = self.collection.find(data)
+                documents = self.collection.find(data, projection = projection)
 
             logging.debug("Retrieved all documents")
         except pymongo.errors.OperationFailure as e:
             logging.error("Retrieve failed: %s" % (str(e)))
 
         return documents
+
+
+    def encode(self, array):
+        """ Encodes an array for storage.
+
+        The encode() method returns the binary document of \a array, with its
+        payload in GridFS if it is too big to be inlined.
+
+        @see snapshot.encode()
+
+        @param self  the object pointer,
+        @param array the array.
+
+        @return the array document.
+        """
+        return snapshot.encode(array, self.compression, self.fs)
+
+
+    def decode(self, document):
+        """ Decodes a stored array.
+
+        @see snapshot.decode()
+
+        @param self     the object pointer,
+        @param document the array document.
+
+        @return the array.
+        """
+        return snapshot.decode(document, self.fs)
@@ -4,9 +4,8 @@ Provides a monitor for the solver.
 The monitor is in charge to run the solver and make sure no problem occurs.
 """
 import sys
-
-import bson
-import pickle
+import signal
+import threading
 
 import logging
 
@@ -15,54 +14,93 @@ import time
 import numpy as np
 import matplotlib.pyplot as plt
 
-from mongoDBConnection import MongoDBConnection
+from snapshotWriter import SnapshotWriter
+from metrics import Metrics, Profiler
 
+import backends
+import cache
 import fieldGenerator
+import grid
+import numpySolver
 import postProcessor
-import solver
+import storage
+import vtkExport
 
 from const import *
 
 
-def connect_db(mongodb):
-    """ Creates connection with MongoDB.
+def connect_db(mongodb, settings = {}):
+    """ Creates connection with the storage.
 
-    @param mongodb the MongoDB instance.
+    @see storage.connect()
 
-    @return the MongoDB connection.
-    """
-    db = MongoDBConnection(mongodb['host'], mongodb['username'],
-                           mongodb['password'], mongodb['dbname'])
-    db.use(mongodb['dbname'], mongodb['collection'])
+    @param mongodb  the MongoDB instance,
+    @param settings the storage settings.
 
-    return db
+    @return the storage connection.
+    """
+    return storage.connect(mongodb, settings)
 
 
-def extract(data):
+def extract(db, data):
     """ Extracts data from a MongoDB document.
 
+    The extract() function completes the snapshot \a data with the metadata of
+    its run.
+
+    @param db   the database connection,
     @param data the MongoDB document.
 
     @return the data extracted.
     """
+    run = db.retrieve_run(data['checksum'])
+    psi = db.decode(data['psi'])
+
     res = [
         data['checksum'],
-        pickle.loads(data['v0']),
-        pickle.loads(data['psi']),
-        np.asfortranarray(np.real(pickle.loads(data['psi']))),
-        np.asfortranarray(np.imag(pickle.loads(data['psi']))),
-        data['scheme'],
+        run['v0'],
+        psi,
+        np.asfortranarray(np.real(psi)),
+        np.asfortranarray(np.imag(psi)),
+        run['scheme'],
         data['t'],
-        data['span'],
+        run['span'],
+        grid.get(*run['grid']),
+        run['t_max'],
+        run['dt'],
     ]
 
     return res
 
 
-def compute(db, checksum, v0, psi, r_part, i_part, scheme, t, span):
+def compute(db, checksum, v0, psi, r_part, i_part, scheme, t, span, grid,
+            t_max, dt, backend = "native", writer = {}, series = None,
+            threads = 0, processes = 0, metrics = {}, observables = {}):
     """ Runs the solver.
 
-    The compute() function runs the solver and saves results in \a db.
+    The compute() function runs the solver and saves results in \a db. The
+    snapshots are written by a background writer; on SIGINT, the computation
+    stops at the end of the current span, the pending snapshots are flushed,
+    then KeyboardInterrupt is raised.
+
+    If \a series is specified, then a VTI frame is also written every
+    series.every time steps, independently of the span.
+
+    The observables of psi (norm, mean position, energy and flux) are computed
+    by the solver every observables.every time steps, without building psi,
+    and written with the next snapshot. They are also computed for each
+    snapshot, whose norm is taken from them.
+
+    Each phase of the loop is timed, and the metrics of the run are emitted
+    every metrics.interval seconds. If metrics.profile is set, then its window
+    of steps is profiled with cProfile.
+
+    The solver runs in single precision if the parts of psi are float32, as
+    generated for a "single" precision run, so its snapshots stay complex64.
+
+    The solver adopts padded copies of the parts as its storage, and its state
+    is read through views, so each snapshot is built without any transient
+    copy of the parts.
 
     @param db       the database connection,
     @param checksum the run checksum,
@@ -72,89 +110,271 @@ def compute(db, checksum, v0, psi, r_part, i_part, scheme, t, span):
     @param i_part   imaginary part of psi,
     @param scheme   the scheme,
     @param t        the current execution time,
-    @param span     the span between insert in database.
+    @param span     the span between insert in database,
+    @param grid     the grid,
+    @param t_max    the simulation time,
+    @param dt       the time step,
+    @param backend  the solver backend,
+    @param writer   the snapshot writer settings,
+    @param series   the in-situ VTK output,
+    @param threads   the number of solver threads, 0 for the default,
+    @param processes the number of processes of the distributed solver,
+    @param metrics   the metrics settings,
+    @param observables the observables settings.
+
+    @return the number of steps computed, the time elapsed and the final norm.
     """
-    if scheme == "ftcs":
-        dt = DT_FTCS
-    elif scheme == "btcs":
-        dt = DT_BTCS
-    elif scheme == "ctcs":
-        dt = DT_CTCS
+    precision = "single" if r_part.dtype == np.float32 else "double"
+    Solver = backends.load(backend, precision)
+    real, cplx = TYPES[precision]
+
+    solv = Solver(numpySolver.padded(np.asarray(v0, dtype = real)),
+                  numpySolver.padded(r_part), numpySolver.padded(i_part),
+                  H_BAR, M, scheme, grid.dx, grid.dy, dt, True)
+    solv.set_threads(threads)
+
+    if hasattr(solv, "set_processes"):
+        solv.set_processes(processes)
 
-    solv = solver.Solver(np.asfortranarray(v0), r_part, i_part, H_BAR, M, scheme,
-                         (X_MAX - X_MIN) / N_X, (Y_MAX - Y_MIN) / N_Y, dt)
+    logging.info("Solver threads: %d" % (solv.threads()))
 
     logging.info("Norm: %f" % (np.linalg.norm(psi)))
 
     count = 0
-    V0    = pickle.dumps(v0)
+    step  = round(t / dt)
+    steps = round(t_max / dt) - step
+    every = span
+
+    if series != None and series.every > 0:
+        every = series.every
+
+    sample  = observables.get('every', 0) or span
+    samples = []
+
+    interrupted = []
+
+    def interrupt(signum, frame):
+        logging.warning("Interrupted, flushing pending snapshots")
+        interrupted.append(signum)
+
+    if threading.current_thread() is threading.main_thread():
+        handler = signal.signal(signal.SIGINT, interrupt)
+
+    meter = Metrics(metrics.get('output'), metrics.get('interval', 10),
+                    metrics.get('format', "jsonl"), steps, dt)
+    profiler = Profiler(**metrics.get('profile', {}))
+
+    snapshots = SnapshotWriter(db, metrics = meter, **writer)
 
     begin = time.time()
 
-    while t <= T_MAX:
-        solv.compute()
-        t = t + dt
-        count = count + 1
+    try:
+        while count < steps and not interrupted:
+            n = min(span - step % span, every - step % every,
+                    sample - step % sample, steps - count,
+                    profiler.limit(count))
+
+            profiler.before(count)
+
+            with meter.phase("kernel"):
+                solv.compute(n)
+
+            step = step + n
+            t = step * dt
+            count = count + n
+
+            profiler.after(count)
+
+            if series != None and (step % every == 0 or count == steps):
+                with meter.phase("series"):
+                    series.write(step, t, solv.r_view(), solv.i_view())
+
+            record   = step % sample == 0 or count == steps
+            snapshot = step % span == 0 or count == steps
+
+            if record or snapshot:
+                with meter.phase("observables"):
+                    values = dict(solv.observables(grid.x_min, grid.y_min))
+
+                if record:
+                    samples.append(dict(values, checksum = checksum, t = t))
+
+            if snapshot:
+                with meter.phase("psi"):
+                    psi = np.empty(r_part.shape, dtype = cplx, order = 'F')
+                    psi.real = solv.r_view()
+                    psi.imag = solv.i_view()
+
+                norm = values['norm']
+                logging.debug("Norm: %f" % (norm))
+
+                with meter.phase("submit"):
+                    snapshots.submit({"checksum": checksum, "t": t,
+                                      "psi": psi, "norm": norm,
+                                      "observables": samples})
+
+                samples = []
 
-        if count >= span:
-            psi = solv.r_part() + 1j * solv.i_part()
-            logging.debug("Norm: %f" % (np.linalg.norm(psi)))
-            db.insert({"checksum": checksum, "v0": V0,
-                       "psi": pickle.dumps(psi), "norm": np.linalg.norm(psi),
-                       "scheme": scheme, "t": t, "span": span})
-            count = 0
+            meter.progress(step, count)
+            meter.gauge("queue", snapshots.queue.qsize())
+            meter.report()
+    finally:
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, handler)
 
-    end = time.time()
+        profiler.close()
+        snapshots.close()
+
+        # The samples taken since the last snapshot, if the run is interrupted.
+        db.insert_observables(samples)
+        meter.report(True)
+
+        if hasattr(solv, "close"):
+            solv.close()
+
+    if interrupted:
+        raise KeyboardInterrupt
+
+    end  = time.time()
+    norm = float(np.linalg.norm(psi))
 
     logging.info("Calculation terminated, time elapsed: %f" % (end - begin))
-    logging.info("Norm: %f" % (np.linalg.norm(psi)))
+    logging.info("Steps per second: %f" % (count / (end - begin)))
+    logging.info("Norm: %f" % (norm))
+
+    return {"steps": count, "time": end - begin, "norm": norm}
 
 
-def run(mongodb, param_file, output):
+def run(mongodb, param_file, output, backend = "native", writer = {},
+        vtk = {}, store = {}, interactive = True, threads = 0,
+        processes = 0, metrics = {}, observables = {}):
     """ Monitor main function.
 
-    @param mongodb    the MongoDB instance,
-    @param param_file the path to the parameters file.
+    If \a interactive is false, then the initial VTK is not generated and the
+    computation starts without asking for confirmation.
+
+    If the same run is already done in the storage, then nothing is computed:
+    its VTK files are generated from the stored snapshots. Otherwise, the
+    least recently used runs are evicted once the run is done, as set by
+    store.cache.
+
+    @see cache.prune()
+
+    @param mongodb     the MongoDB instance,
+    @param param_file  the path to the parameters file,
+    @param output      the VTK output directory,
+    @param backend     the solver backend,
+    @param writer      the snapshot writer settings,
+    @param vtk         the VTK export settings,
+    @param store       the storage settings,
+    @param interactive whether the initial state is confirmed by the user,
+    @param threads     the number of solver threads, 0 for the default,
+    @param processes   the number of processes of the distributed solver,
+    @param metrics     the metrics settings,
+    @param observables the observables settings.
+
+    @return the run checksum, the compute() statistics and whether the run was
+            served from the cache.
     """
     print("Initialisation...")
 
-    db = connect_db(mongodb)
+    db = connect_db(mongodb, store)
     logging.debug("MongoDB initialised")
 
-    run_id = fieldGenerator.generate(param_file, db)
+    checksum, restart = fieldGenerator.generate(param_file, db,
+                                                writer.get('levels', ()))
     logging.debug("Field initialised")
 
-    document = db.retrieve()
-    data     = extract(document)
+    document = db.retrieve_checkpoint(checksum)
+    run      = db.retrieve_run(checksum)
+
+    # A restarted run keeps the preview levels it started with.
+    writer = dict(writer, levels = run.get('levels', []))
+
+    if run.get('status') == "done":
+        print("Cached run found.")
+        logging.info("Run %s served from the cache" % (checksum))
+        cache.touch(db, checksum)
+
+        print("Generating VTK...")
+
+        vtkExport.export(db, checksum, output, vtk.get('workers'),
+                         vtk.get('in_flight'))
+
+        print("Done.")
+
+        return {"checksum": checksum, "steps": 0, "time": 0.0,
+                "norm": document['norm'], "cached": True}
+
+    data     = extract(db, document)
+    series   = None
+
+    if vtk.get('in_situ', False):
+        series = postProcessor.TimeSeries(output, data[1], vtk.get('every', 0),
+                                          vtkExport.claim(output, checksum))
+
+    if not restart:
+        if series != None:
+            series.write(0, data[6], data[3], data[4])
 
-    if run_id == None:
-        postProcessor.generate_init_vti(data[1], data[3], data[4], output)
+        if interactive:
+            postProcessor.generate_init_vti(data[1], data[3], data[4], output)
 
-        print("Initial VTK generated in %s" % output)
-        c = input("Continue? [Y/n] ")
+            print("Initial VTK generated in %s" % output)
+            c = input("Continue? [Y/n] ")
 
-        if c != "Y":
-            print("Calculation aborted.")
-            db.insert({"checksum": None})
-            sys.exit(0)
+            if c != "Y":
+                print("Calculation aborted.")
+                db.discard(checksum)
+                sys.exit(0)
     else:
         print("Restarting previous run...")
-        logging.info("Previous run interrupted, restarting...")
+        logging.info("Previous run found, restarting from t = %g"
+                     % (document['t']))
 
     print("Calculating...")
     logging.info("Starting simulation")
 
-    compute(db, *data)
+    stats = compute(db, *data, backend = backend, writer = writer,
+                    series = series, threads = threads,
+                    processes = processes, metrics = metrics,
+                    observables = observables)
     logging.debug("Compute terminated")
 
-    print("Generating VTK...")
+    if series == None:
+        print("Generating VTK...")
 
-    count = 0
+        vtkExport.export(db, checksum, output, vtk.get('workers'),
+                         vtk.get('in_flight'))
+
+    print("Done.")
+    db.update_run(checksum, {"status": "done", "used": time.time(),
+                             "bytes": cache.size(db, checksum)})
+    cache.prune(db, store.get('cache', {}), keep = checksum)
+
+    return dict(stats, checksum = checksum, cached = False)
+
+
+def export(mongodb, checksum, output, vtk = {}, store = {}):
+    """ Exports a completed run to VTK files.
+
+    The frames of the run already in \a output are kept, so an interrupted
+    export can be resumed.
+
+    @see vtkExport.export()
+
+    @param mongodb  the MongoDB instance,
+    @param checksum the run checksum,
+    @param output   the VTK output directory,
+    @param vtk      the VTK export settings,
+    @param store    the storage settings.
+    """
+    db = connect_db(mongodb, store)
+    logging.debug("MongoDB initialised")
+
+    print("Generating VTK...")
 
-    for i in db.retrieve_all({"checksum": document['checksum']}):
-        data = extract(i)
-        postProcessor.generate_vti(data[1], data[3], data[4], count, output)
-        count = count + 1
+    vtkExport.export(db, checksum, output, vtk.get('workers'),
+                     vtk.get('in_flight'))
 
     print("Done.")
-    db.insert({"checksum": None})
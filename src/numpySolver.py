@@ -0,0 +1,593 @@
+""" @package numpySolver.py
+Provides a pure NumPy implementation of the solver.
+
+The numpySolver package mirrors the Solver class of the native bindings: same
+constructors, same schemes and same compute(), r_part(), i_part(), r_view() and
+i_view() methods.
+It is used when the native extension is unavailable, and as a reference to
+check the results and the performance of the native solver.
+"""
+import numpy as np
+
+
+def padded(m):
+    """ Adds padding to a matrix.
+
+    @param m a matrix.
+
+    @return the matrix with padding, in Fortran order.
+    """
+    res = np.zeros((m.shape[0] + 2, m.shape[1] + 2), dtype = m.dtype,
+                   order = 'F')
+    res[1:-1, 1:-1] = m
+
+    return res
+
+
+def observables(rpart, ipart, v0, h_bar, m, dx, dy, x_min, y_min):
+    """ Computes the observables of psi.
+
+    @see Solver::observables() of the native solver.
+
+    @param rpart the padded real part,
+    @param ipart the padded imaginary part,
+    @param v0    the potentiel field,
+    @param h_bar the Planck constant,
+    @param m     the particle masse,
+    @param dx    the x step,
+    @param dy    the y step,
+    @param x_min the x coordinate of the first row,
+    @param y_min the y coordinate of the first column.
+
+    @return the norm, the mean position, energy and flux of psi.
+    """
+    r = rpart.astype(np.float64)
+    i = ipart.astype(np.float64)
+
+    rc, ic = r[1:-1, 1:-1], i[1:-1, 1:-1]
+
+    def laplacian(a):
+        return ((a[:-2, 1:-1] + a[2:, 1:-1] - 2 * a[1:-1, 1:-1]) / (dx * dx)
+                + (a[1:-1, :-2] + a[1:-1, 2:] - 2 * a[1:-1, 1:-1]) / (dy * dy))
+
+    p = rc * rc + ic * ic
+    s = p.sum()
+
+    res = {"norm": np.sqrt(s)}
+
+    if s > 0:
+        x = x_min + dx * np.arange(p.shape[0])[:, np.newaxis]
+        y = y_min + dy * np.arange(p.shape[1])[np.newaxis, :]
+
+        kinetic = (rc * laplacian(r) + ic * laplacian(i)).sum()
+        flux_x = (rc * (i[2:, 1:-1] - i[:-2, 1:-1])
+                  - ic * (r[2:, 1:-1] - r[:-2, 1:-1])).sum()
+        flux_y = (rc * (i[1:-1, 2:] - i[1:-1, :-2])
+                  - ic * (r[1:-1, 2:] - r[1:-1, :-2])).sum()
+
+        res["x"] = (x * p).sum() / s
+        res["y"] = (y * p).sum() / s
+        res["energy"] = (-h_bar * h_bar / (2 * m) * kinetic
+                         + (np.asarray(v0, dtype = np.float64) * p).sum()) / s
+        res["flux_x"] = h_bar / m * flux_x / (2 * dx * s)
+        res["flux_y"] = h_bar / m * flux_y / (2 * dy * s)
+
+    return {key: float(value) for key, value in res.items()}
+
+
+class Solver:
+    """ Solver class.
+
+    The Solver class keeps the real and imaginary parts of psi in padded
+    Fortran-ordered arrays, like the native solver. All the buffers of the
+    scheme are allocated by the constructor, and the time steps update them in
+    place.
+    """
+
+    """ The real type of the buffers. """
+    DTYPE = np.float64
+
+    """ The complex type of the buffers. """
+    CDTYPE = np.complex128
+
+    def __init__(self, v0, r_part, i_part, *args):
+        """ Solver constructor.
+
+        The Solver constructor takes the same arguments as the native one,
+        either (v0, r_part, i_part, scheme, dx, dy, dt), with the Planck
+        constant and the particle masse set to 1.0, or
+        (v0, r_part, i_part, h_bar, m, scheme, dx, dy, dt), or
+        (v0, r_part, i_part, h_bar, m, scheme, dx, dy, dt, adopt) with padded
+        arrays, as returned by padded(). If adopt is true, then the padded
+        parts become the buffers of the solver and are updated in place.
+
+        @param self   the object pointer,
+        @param v0     the potentiel field,
+        @param r_part the real part,
+        @param i_part the imaginary part,
+        @param args   the scheme parameters.
+        """
+        adopt = None
+
+        if len(args) == 4:
+            h_bar, m = 1.0, 1.0
+            scheme, dx, dy, dt = args
+        elif len(args) == 6:
+            h_bar, m, scheme, dx, dy, dt = args
+        elif len(args) == 7:
+            h_bar, m, scheme, dx, dy, dt, adopt = args
+        else:
+            raise TypeError("Solver() takes 7, 9 or 10 arguments (%d given)"
+                            % (3 + len(args)))
+
+        self.scheme = scheme
+        self.h_bar, self.m = h_bar, m
+        self.dx, self.dy, self.dt = dx, dy, dt
+
+        if adopt == None:
+            self.rpart = padded(np.asarray(r_part, dtype = self.DTYPE))
+            self.ipart = padded(np.asarray(i_part, dtype = self.DTYPE))
+        else:
+            if np.shape(r_part) != np.shape(v0) \
+               or np.shape(i_part) != np.shape(v0):
+                raise RuntimeError("The padded parts and potentiel field "
+                                   "must have the same size")
+
+            if adopt:
+                for part in (r_part, i_part):
+                    if part.dtype != self.DTYPE \
+                       or not part.flags.f_contiguous:
+                        raise TypeError("Adopted parts must be Fortran "
+                                        "contiguous %s arrays"
+                                        % (np.dtype(self.DTYPE).name))
+
+                self.rpart, self.ipart = r_part, i_part
+            else:
+                self.rpart = np.array(r_part, dtype = self.DTYPE, order = 'F')
+                self.ipart = np.array(i_part, dtype = self.DTYPE, order = 'F')
+
+            v0 = np.asarray(v0)[1:-1, 1:-1]
+
+        self.v0 = np.asarray(v0, dtype = self.DTYPE)
+
+        self.const_dx = dt * h_bar / (2 * m * dx * dx)
+        self.const_dy = dt * h_bar / (2 * m * dy * dy)
+
+        self.potentiel = np.asfortranarray((-dt / h_bar) * np.asarray(v0)
+                                           - 2 * self.const_dx
+                                           - 2 * self.const_dy,
+                                           dtype = self.DTYPE)
+
+        self.work = np.zeros_like(self.potentiel)
+        self.tmp  = np.zeros_like(self.potentiel)
+
+        schemes = {
+            "ftcs": (self.init_ftcs, self.ftcs),
+            "btcs": (lambda: self.factorize(1.0), self.btcs),
+            "ctcs": (lambda: self.factorize(0.5), self.ctcs),
+            "adi":  (self.thomas, self.adi),
+            "fft":  (self.spectral, self.fft),
+        }
+
+        init, self.method = schemes.get(scheme, (None, None))
+
+        if init != None:
+            init()
+
+
+    def compute(self, n = 1):
+        """ Computes the next psi values.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        if self.method != None:
+            self.method(n)
+
+
+    def r_part(self):
+        """ Returns the real part.
+
+        @param self the object pointer.
+
+        @return the current real part.
+        """
+        return self.rpart[1:-1, 1:-1].copy(order = 'F')
+
+
+    def i_part(self):
+        """ Returns the imaginary part.
+
+        @param self the object pointer.
+
+        @return the current imaginary part.
+        """
+        return self.ipart[1:-1, 1:-1].copy(order = 'F')
+
+
+    def r_view(self, writable = False):
+        """ Returns a view of the real part.
+
+        The view shares the buffer of the solver, so it follows compute().
+
+        @param self     the object pointer,
+        @param writable whether the view is writable.
+
+        @return the current real part, without copy.
+        """
+        view = self.rpart[1:-1, 1:-1]
+        view.flags.writeable = writable
+
+        return view
+
+
+    def i_view(self, writable = False):
+        """ Returns a view of the imaginary part.
+
+        @see r_view()
+
+        @param self     the object pointer,
+        @param writable whether the view is writable.
+
+        @return the current imaginary part, without copy.
+        """
+        view = self.ipart[1:-1, 1:-1]
+        view.flags.writeable = writable
+
+        return view
+
+
+    def observables(self, x_min, y_min):
+        """ Computes the observables of psi.
+
+        @see observables()
+
+        @param self  the object pointer,
+        @param x_min the x coordinate of the first row,
+        @param y_min the y coordinate of the first column.
+
+        @return the norm, the mean position, energy and flux of psi.
+        """
+        return observables(self.rpart, self.ipart, self.v0, self.h_bar, self.m,
+                           self.dx, self.dy, x_min, y_min)
+
+
+    def set_parts(self, r_part, i_part):
+        """ Replaces the real and imaginary parts.
+
+        The new parts are copied in the current buffers, which must have the
+        same shape.
+
+        @param self   the object pointer,
+        @param r_part the real part,
+        @param i_part the imaginary part.
+        """
+        self.rpart[1:-1, 1:-1] = r_part
+        self.ipart[1:-1, 1:-1] = i_part
+
+
+    def set_threads(self, n):
+        """ Sets the number of threads.
+
+        NumPy runs the schemes on a single thread, the number of threads is
+        only kept for threads().
+
+        @param self the object pointer,
+        @param n    the number of threads, 0 for the default.
+        """
+        self.n_threads = n
+
+
+    def threads(self):
+        """ Returns the number of threads.
+
+        @param self the object pointer.
+
+        @return the number of threads used by the schemes.
+        """
+        return 1
+
+
+    def stencil(self, a, out):
+        """ Applies the 5-point stencil.
+
+        The stencil() method writes in \a out the product of the interior of
+        \a a with the scheme operator, -dt H / h_bar.
+
+        @param self the object pointer,
+        @param a    a padded matrix,
+        @param out  the output matrix.
+        """
+        np.multiply(self.potentiel, a[1:-1, 1:-1], out = out)
+
+        np.add(a[:-2, 1:-1], a[2:, 1:-1], out = self.tmp)
+        self.tmp *= self.const_dx
+        out += self.tmp
+
+        np.add(a[1:-1, :-2], a[1:-1, 2:], out = self.tmp)
+        self.tmp *= self.const_dy
+        out += self.tmp
+
+
+    def init_ftcs(self):
+        """ Allocates the FTCS next step buffers.
+
+        @param self the object pointer.
+        """
+        self.nrpart = np.zeros_like(self.rpart)
+        self.nipart = np.zeros_like(self.ipart)
+
+
+    def ftcs(self, n):
+        """ FTCS compute scheme.
+
+        The steps alternate between the current and the next step buffers,
+        and the result is copied back after an odd number of steps, so the
+        views of the parts stay valid.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        r, i = self.rpart, self.ipart
+        nr, ni = self.nrpart, self.nipart
+
+        for _ in range(n):
+            self.stencil(i, self.work)
+            np.subtract(r[1:-1, 1:-1], self.work, out = nr[1:-1, 1:-1])
+
+            self.stencil(r, self.work)
+            np.add(i[1:-1, 1:-1], self.work, out = ni[1:-1, 1:-1])
+
+            r, nr = nr, r
+            i, ni = ni, i
+
+        if r is not self.rpart:
+            self.rpart[1:-1, 1:-1] = r[1:-1, 1:-1]
+            self.ipart[1:-1, 1:-1] = i[1:-1, 1:-1]
+
+
+    def factorize(self, theta):
+        """ Factorizes the implicit scheme matrix.
+
+        The matrix (I + i theta dt H / h_bar) is block tridiagonal, one block
+        per column of the grid. The factorize() method computes the inverses of
+        the Schur complements of its block LU factorization.
+
+        @param self  the object pointer,
+        @param theta the implicit weight of the scheme.
+        """
+        n_rows, n_cols = self.potentiel.shape
+
+        off  = -1j * theta * self.const_dx
+        beta = -1j * theta * self.const_dy
+
+        self.beta  = beta
+        self.schur = np.empty((n_cols, n_rows, n_rows), dtype = self.CDTYPE)
+
+        for j in range(n_cols):
+            d = np.diag(1 - 1j * theta * self.potentiel[:, j])
+            d += np.diag(np.full(n_rows - 1, off), 1)
+            d += np.diag(np.full(n_rows - 1, off), -1)
+
+            if j > 0:
+                d -= beta * beta * self.schur[j - 1]
+
+            self.schur[j] = np.linalg.inv(d)
+
+        self.cpsi  = np.zeros(self.potentiel.shape, dtype = self.CDTYPE, order = 'F')
+        self.chalf = np.zeros(n_rows, dtype = self.CDTYPE)
+
+
+    def implicit(self, n, theta):
+        """ Implicit compute scheme.
+
+        Builds the right hand side (I - i theta dt H / h_bar) psi with the
+        stencil, then solves the system by block forward and backward
+        substitutions.
+
+        @param self  the object pointer,
+        @param n     the number of time steps,
+        @param theta the explicit weight of the scheme.
+        """
+        b = self.cpsi
+        v = self.chalf
+
+        for _ in range(n):
+            self.stencil(self.ipart, self.work)
+            np.multiply(self.work, -theta, out = b.real)
+            b.real += self.rpart[1:-1, 1:-1]
+
+            self.stencil(self.rpart, self.work)
+            np.multiply(self.work, theta, out = b.imag)
+            b.imag += self.ipart[1:-1, 1:-1]
+
+            for j in range(b.shape[1]):
+                if j > 0:
+                    np.multiply(b[:, j - 1], self.beta, out = v)
+                    np.subtract(b[:, j], v, out = v)
+                else:
+                    v[:] = b[:, j]
+
+                np.dot(self.schur[j], v, out = b[:, j])
+
+            for j in range(b.shape[1] - 2, -1, -1):
+                np.dot(self.schur[j], b[:, j + 1], out = v)
+                v *= self.beta
+                b[:, j] -= v
+
+            self.rpart[1:-1, 1:-1] = b.real
+            self.ipart[1:-1, 1:-1] = b.imag
+
+
+    def btcs(self, n):
+        """ BTCS compute scheme.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        self.implicit(n, 0.0)
+
+
+    def ctcs(self, n):
+        """ CTCS compute scheme.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        self.implicit(n, 0.5)
+
+
+    def thomas(self):
+        """ Prepares the ADI tridiagonal systems.
+
+        @param self the object pointer.
+        """
+        n_rows, n_cols = self.potentiel.shape
+
+        self.offx = -0.5j * self.const_dx
+        self.offy = -0.5j * self.const_dy
+
+        self.ax = 0.5 * self.potentiel + self.const_dy - self.const_dx
+        self.ay = 0.5 * self.potentiel + self.const_dx - self.const_dy
+
+        bx = 1 - 0.5j * self.ax
+        by = 1 - 0.5j * self.ay
+
+        self.invx = np.empty(bx.shape, dtype = self.CDTYPE, order = 'F')
+        self.invy = np.empty(by.shape, dtype = self.CDTYPE, order = 'F')
+
+        self.invx[0] = 1 / bx[0]
+        for l in range(1, n_rows):
+            self.invx[l] = 1 / (bx[l] - self.offx * self.offx * self.invx[l - 1])
+
+        self.invy[:, 0] = 1 / by[:, 0]
+        for j in range(1, n_cols):
+            self.invy[:, j] = 1 / (by[:, j] - self.offy * self.offy
+                                   * self.invy[:, j - 1])
+
+        self.upx = self.offx * self.invx
+        self.upy = self.offy * self.invy
+
+        shape = self.rpart.shape
+
+        self.cpsi  = np.zeros(shape, dtype = self.CDTYPE, order = 'F')
+        self.chalf = np.zeros(shape, dtype = self.CDTYPE, order = 'F')
+        self.cwork = np.zeros(self.potentiel.shape, dtype = self.CDTYPE, order = 'F')
+        self.ctmp  = np.zeros(self.potentiel.shape, dtype = self.CDTYPE, order = 'F')
+        self.crow  = np.zeros(n_cols, dtype = self.CDTYPE)
+        self.ccol  = np.zeros(n_rows, dtype = self.CDTYPE)
+
+
+    def adi(self, n):
+        """ ADI compute scheme.
+
+        Peaceman-Rachford scheme: a x-sweep, implicit in x and explicit in y,
+        followed by a y-sweep, implicit in y and explicit in x. Each sweep
+        solves all the tridiagonal systems of the grid lines together.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        p = self.cpsi[1:-1, 1:-1]
+        h = self.chalf[1:-1, 1:-1]
+
+        p.real = self.rpart[1:-1, 1:-1]
+        p.imag = self.ipart[1:-1, 1:-1]
+
+        for _ in range(n):
+            np.add(self.cpsi[1:-1, :-2], self.cpsi[1:-1, 2:], out = self.cwork)
+            self.cwork *= self.const_dy
+            np.multiply(self.ay, p, out = self.ctmp)
+            self.cwork += self.ctmp
+            self.cwork *= 0.5j
+            np.add(p, self.cwork, out = h)
+
+            h[0] *= self.invx[0]
+            for l in range(1, h.shape[0]):
+                np.multiply(h[l - 1], self.offx, out = self.crow)
+                h[l] -= self.crow
+                h[l] *= self.invx[l]
+
+            for l in range(h.shape[0] - 2, -1, -1):
+                np.multiply(h[l + 1], self.upx[l], out = self.crow)
+                h[l] -= self.crow
+
+            np.add(self.chalf[:-2, 1:-1], self.chalf[2:, 1:-1], out = self.cwork)
+            self.cwork *= self.const_dx
+            np.multiply(self.ax, h, out = self.ctmp)
+            self.cwork += self.ctmp
+            self.cwork *= 0.5j
+            np.add(h, self.cwork, out = p)
+
+            p[:, 0] *= self.invy[:, 0]
+            for j in range(1, p.shape[1]):
+                np.multiply(p[:, j - 1], self.offy, out = self.ccol)
+                p[:, j] -= self.ccol
+                p[:, j] *= self.invy[:, j]
+
+            for j in range(p.shape[1] - 2, -1, -1):
+                np.multiply(p[:, j + 1], self.upy[:, j], out = self.ccol)
+                p[:, j] -= self.ccol
+
+        self.rpart[1:-1, 1:-1] = p.real
+        self.ipart[1:-1, 1:-1] = p.imag
+
+
+    def spectral(self):
+        """ Prepares the split-step Fourier phase factors.
+
+        @param self the object pointer.
+        """
+        n_rows, n_cols = self.potentiel.shape
+
+        kx = 2 * np.pi * np.fft.fftfreq(n_rows, self.dx)
+        ky = 2 * np.pi * np.fft.fftfreq(n_cols, self.dy)
+
+        k2 = kx[:, np.newaxis] ** 2 + ky[np.newaxis, :] ** 2
+
+        half = 0.5 * (self.potentiel + 2 * self.const_dx + 2 * self.const_dy)
+
+        self.phase_v  = np.exp(1j * half).astype(self.CDTYPE)
+        self.phase_vv = self.phase_v * self.phase_v
+        self.phase_k  = np.exp(-1j * self.dt * self.h_bar * k2
+                               / (2 * self.m)).astype(self.CDTYPE)
+
+
+    def fft(self, n):
+        """ Split-step Fourier compute scheme.
+
+        @param self the object pointer,
+        @param n    the number of time steps.
+        """
+        if n == 0:
+            return
+
+        psi = self.rpart[1:-1, 1:-1] + 1j * self.ipart[1:-1, 1:-1]
+        psi *= self.phase_v
+
+        for s in range(n):
+            psi = np.fft.fft2(psi)
+            psi *= self.phase_k
+            psi = np.fft.ifft2(psi)
+
+            if s < n - 1:
+                psi *= self.phase_vv
+            else:
+                psi *= self.phase_v
+
+        self.rpart[1:-1, 1:-1] = psi.real
+        self.ipart[1:-1, 1:-1] = psi.imag
+
+
+class Solver32(Solver):
+    """ Solver32 class.
+
+    The Solver32 class is the single precision Solver: all its buffers, and
+    the parts it returns, are float32.
+    """
+
+    """ The real type of the buffers. """
+    DTYPE = np.float32
+
+    """ The complex type of the buffers. """
+    CDTYPE = np.complex64
@@ -1,6 +1,10 @@
 """ @package postProcessor.py
 Provides a VTK files generator.
 """
+import os
+
+import xml.etree.ElementTree as ET
+
 import numpy as np
 
 from pyevtk.hl import imageToVTK
@@ -46,3 +50,92 @@ def generate_vti(v0, psi_imag_part, psi_real_part, id, output):
     """
     generate_vtk(v0, psi_real_part, psi_imag_part,
                  output + "/output_vti__%04d" % (id))
+
+
+def frame_name(output, step):
+    """ Returns the file name of a frame, without the extension.
+
+    @param output the output directory,
+    @param step   the time step of the frame.
+
+    @return the frame file name.
+    """
+    return output + "/output_vti__%08d" % (step)
+
+
+class TimeSeries:
+    """ TimeSeries class.
+
+    The TimeSeries class writes VTI frames while the solver runs, and keeps a
+    ParaView collection file listing them with their time up to date, so the
+    frames can be watched as they are written.
+    """
+
+    def __init__(self, output, v0, every = 0, resume = True):
+        """ TimeSeries constructor.
+
+        If \a resume is true, then the TimeSeries constructor reads the
+        collection file of \a output, if any, so a restarted run keeps the
+        frames of the previous one.
+
+        @see vtkExport.claim()
+
+        @param self   the object pointer,
+        @param output the output directory,
+        @param v0     the potential field,
+        @param every  the time steps between two frames [default: the span],
+        @param resume whether \a output holds the frames of the same run.
+        """
+        self.output = output
+        self.v0 = v0.astype(np.float32)
+        self.every = every
+        self.file_name = output + "/output_vti.pvd"
+        self.datasets = {}
+
+        os.makedirs(output, exist_ok = True)
+
+        if resume and os.path.exists(self.file_name):
+            for dataset in ET.parse(self.file_name).iter("DataSet"):
+                self.datasets[dataset.get("file")] = float(dataset.get("timestep"))
+
+
+    def write(self, step, t, psi_real_part, psi_imag_part):
+        """ Writes a frame.
+
+        The frame and the collection file are written in temporary files, then
+        renamed, so a reader never sees a partial file.
+
+        @param self          the object pointer,
+        @param step          the time step of the frame,
+        @param t             the time of the frame,
+        @param psi_real_part the real part of the psi function,
+        @param psi_imag_part the imaginary part of the psi function.
+        """
+        file_name = frame_name(self.output, step)
+
+        generate_vtk(self.v0, psi_real_part, psi_imag_part, file_name + ".part")
+        os.replace(file_name + ".part.vti", file_name + ".vti")
+
+        self.datasets[os.path.basename(file_name) + ".vti"] = float(t)
+        self.save()
+
+
+    def save(self):
+        """ Writes the collection file.
+
+        @param self the object pointer.
+        """
+        with open(self.file_name + ".part", "w") as write_file:
+            write_file.write('<?xml version="1.0"?>\n')
+            write_file.write('<VTKFile type="Collection" version="0.1" '
+                             'byte_order="LittleEndian">\n')
+            write_file.write('  <Collection>\n')
+
+            for name, t in sorted(self.datasets.items(), key = lambda d: d[1]):
+                write_file.write('    <DataSet timestep="%.17g" group="" part="0" '
+                                 'file="%s"/>\n' % (t, name))
+
+            write_file.write('  </Collection>\n')
+            write_file.write('</VTKFile>\n')
+
+        os.replace(self.file_name + ".part", self.file_name)
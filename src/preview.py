@@ -0,0 +1,122 @@
+""" @package preview.py
+Provides the multi-resolution previews of the snapshots.
+
+Along with each snapshot, the snapshot writer stores a pyramid of |psi|: the
+modulus downsampled by 2, 4, 8... (the levels set in the writer settings), as
+float32. A level is the mean of |psi| over blocks of level x level points.
+
+The frames() function reads the previews of a run over a time range, through
+the (checksum, level, t) index of the previews, so a quick look at a run only
+reads a fraction of its snapshots.
+"""
+import numpy as np
+
+
+def halve(a):
+    """ Downsamples an array by 2.
+
+    The odd last row or column is repeated, so the edges are kept.
+
+    @param a an array.
+
+    @return the mean of the 2x2 blocks of \a a.
+    """
+    if a.shape[0] % 2 == 1:
+        a = np.concatenate((a, a[-1:, :]), axis = 0)
+
+    if a.shape[1] % 2 == 1:
+        a = np.concatenate((a, a[:, -1:]), axis = 1)
+
+    return 0.25 * (a[0::2, 0::2] + a[1::2, 0::2] + a[0::2, 1::2] + a[1::2, 1::2])
+
+
+def pyramid(psi, levels):
+    """ Returns the pyramid of |psi|.
+
+    @param psi    psi,
+    @param levels the downsampling factors, powers of 2.
+
+    @return the downsampled |psi|, by level.
+    """
+    for level in levels:
+        if level < 2 or level & (level - 1) != 0:
+            raise ValueError("Preview levels must be powers of 2: %d" % (level))
+
+    res = {}
+    a = np.abs(psi).astype(np.float32)
+    level = 1
+
+    while level < max(levels, default = 1):
+        a = halve(a)
+        level = 2 * level
+
+        if level in levels:
+            res[level] = np.asfortranarray(a)
+
+    return res
+
+
+def documents(db, checksum, t, psi, levels):
+    """ Returns the preview documents of a snapshot.
+
+    @see pyramid()
+
+    @param db       the database connection,
+    @param checksum the run checksum,
+    @param t        the snapshot time,
+    @param psi      psi,
+    @param levels   the downsampling factors.
+
+    @return the preview documents, ready for insertion.
+    """
+    return [{"checksum": checksum, "t": t, "level": level,
+             "modulus": db.encode(modulus)}
+            for level, modulus in pyramid(psi, levels).items()]
+
+
+def frames(db, checksum, t_min = None, t_max = None, level = 8):
+    """ Returns the frames of a run over a time range.
+
+    The frames of level 1 are computed from the full snapshots. The other
+    levels must be among the preview levels stored for the run.
+
+    @param db       the database connection,
+    @param checksum the run checksum,
+    @param t_min    the first time, None for the beginning of the run,
+    @param t_max    the last time, None for the end of the run,
+    @param level    the downsampling factor.
+
+    @return the times and the |psi| of the frames, in time order.
+    """
+    if level < 1 or level & (level - 1) != 0:
+        raise ValueError("Preview levels must be powers of 2: %d" % (level))
+
+    if level == 1:
+        data = {"checksum": checksum}
+        t = {}
+
+        if t_min != None:
+            t['$gte'] = t_min
+
+        if t_max != None:
+            t['$lte'] = t_max
+
+        if len(t) > 0:
+            data['t'] = t
+
+        res = [(document['t'], np.abs(db.decode(document['psi'])))
+               for document in db.retrieve_all(data)]
+
+        return sorted(res, key = lambda frame: frame[0])
+
+    run = db.retrieve_run(checksum)
+
+    if run == None:
+        raise ValueError("Unknown run: %s" % (checksum))
+
+    if level not in run.get('levels', []):
+        raise ValueError("No previews of level %d for run %s, levels: %s"
+                         % (level, checksum, run.get('levels', [])))
+
+    return [(document['t'], document['modulus'])
+            for document in db.retrieve_previews(checksum, level, t_min, t_max)]
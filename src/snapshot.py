@@ -0,0 +1,120 @@
+""" @package snapshot.py
+Provides the binary format of the arrays stored in the database.
+
+An array is stored as a small document holding its dtype, shape and memory
+order, and its raw bytes, optionally compressed, with their size. Payloads bigger than a
+threshold are stored in GridFS chunks instead of inline, so documents stay far
+below the BSON size limit whatever the grid size.
+"""
+import zlib
+
+import numpy as np
+
+from bson.binary import Binary
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Payloads bigger than this size (in bytes) are stored in GridFS.
+GRIDFS_THRESHOLD = 4 * 1024 * 1024
+
+# Compression functions, by name: (compress, decompress).
+COMPRESSIONS = {
+    "none": (None, None),
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+
+if lz4 != None:
+    COMPRESSIONS["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+
+
+def encode(array, compression = "none", fs = None, threshold = GRIDFS_THRESHOLD):
+    """ Encodes an array.
+
+    The encode() function returns the document describing \a array. Its bytes
+    are taken in the array own memory order, so Fortran-ordered arrays are not
+    reordered.
+
+    @param array       the array,
+    @param compression the compression name,
+    @param fs          the GridFS instance for big payloads,
+    @param threshold   the payload size over which GridFS is used.
+
+    @return the array document.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: %s" % (compression))
+
+    if array.flags.f_contiguous and not array.flags.c_contiguous:
+        order = 'F'
+        data  = memoryview(array.T).cast('B')
+    else:
+        order = 'C'
+        data  = memoryview(np.ascontiguousarray(array)).cast('B')
+
+    compress, _ = COMPRESSIONS[compression]
+
+    if compress != None:
+        data = compress(data)
+
+    document = {"dtype": array.dtype.str, "shape": list(array.shape),
+                "order": order, "compression": compression,
+                "size": len(data)}
+
+    if fs != None and len(data) > threshold:
+        document['gridfs'] = fs.put(bytes(data))
+    else:
+        document['data'] = Binary(data)
+
+    return document
+
+
+def size(document):
+    """ Returns the size of a stored array.
+
+    @param document the array document, or the array itself for the storages
+                    which write arrays as they are.
+
+    @return the size of the payload written, in bytes.
+    """
+    if isinstance(document, np.ndarray):
+        return document.nbytes
+
+    return document['size']
+
+
+def decode(document, fs = None):
+    """ Decodes an array.
+
+    The decode() function rebuilds the array described by \a document. An
+    uncompressed payload is not copied: the array is a read-only view of the
+    document bytes, or of the file mapped in memory if the payload is stored
+    in a file.
+
+    @param document the array document,
+    @param fs       the GridFS instance for big payloads.
+
+    @return the array.
+    """
+    if 'file' in document:
+        return np.memmap(document['file'], dtype = np.dtype(document['dtype']),
+                         mode = "r", offset = document['offset'],
+                         shape = tuple(document['shape']),
+                         order = document['order'])
+
+    if 'gridfs' in document:
+        data = fs.get(document['gridfs']).read()
+    else:
+        data = document['data']
+
+    _, decompress = COMPRESSIONS[document['compression']]
+
+    if decompress != None:
+        data = decompress(data)
+
+    return np.frombuffer(data, dtype = np.dtype(document['dtype'])).reshape(
+        document['shape'], order = document['order'])
+
@@ -0,0 +1,215 @@
+""" @package snapshotWriter.py
+Provides an asynchronous snapshot writer.
+
+The snapshot writer takes snapshots from the compute loop and writes them in the
+database from a background thread, so the solver does not wait on the database.
+"""
+import queue
+import threading
+
+import logging
+
+import numpy as np
+
+from metrics import Metrics
+
+import preview
+import snapshot
+
+
+class SnapshotWriter(threading.Thread):
+    """ SnapshotWriter class.
+
+    The SnapshotWriter class is a write-behind thread: snapshots are queued by
+    submit(), encoded and inserted by batches with insert_many(). The queue is
+    bounded, so submit() blocks when the database falls behind the solver.
+
+    If preview levels are set, then the writer also builds and inserts the
+    pyramid of |psi| of each snapshot.
+
+    @see preview.pyramid()
+    """
+
+    """ End of the snapshots marker. """
+    CLOSE = None
+
+
+    def __init__(self, db, queue_size = 8, batch_size = 16, w = 1, j = False,
+                 metrics = None, levels = ()):
+        """ SnapshotWriter constructor.
+
+        The SnapshotWriter constructor creates and starts the writer thread.
+
+        @param self       the object pointer,
+        @param db         the database connection,
+        @param queue_size the maximum number of pending snapshots,
+        @param batch_size the maximum number of snapshots per insertion,
+        @param w          the write concern number of nodes,
+        @param j          the write concern journal acknowledgment,
+        @param metrics    the metrics of the run,
+        @param levels     the preview levels, none to store no preview.
+        """
+        super().__init__(name = "SnapshotWriter", daemon = True)
+
+        self.db = db
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.batch_size = batch_size
+        self.w, self.j = w, j
+        self.metrics = metrics or Metrics()
+        self.levels = tuple(levels)
+
+        self.error = None
+        self.written = 0
+
+        self.start()
+
+
+    def submit(self, document):
+        """ Queues a snapshot.
+
+        The submit() method queues \a document, whose array values are encoded
+        by the writer thread. It blocks while the queue is full.
+
+        @param self     the object pointer,
+        @param document the snapshot.
+        """
+        if self.error != None:
+            raise self.error
+
+        if self.queue.full():
+            logging.debug("Snapshot queue full, waiting for the database")
+
+        self.queue.put(document)
+
+
+    def close(self):
+        """ Flushes the pending snapshots and stops the writer.
+
+        The writer always holds back the latest snapshot, so the last batch is
+        never empty. It is written with a journaled write concern: once it is
+        acknowledged, all the snapshots before it are durable too.
+
+        @param self the object pointer.
+        """
+        self.queue.put(self.CLOSE)
+        self.join()
+
+        logging.info("%d snapshots written" % (self.written))
+
+        if self.error != None:
+            raise self.error
+
+
+    def encode(self, document):
+        """ Encodes the array values of a snapshot.
+
+        @param self     the object pointer,
+        @param document the snapshot.
+
+        @return the snapshot ready for insertion.
+        """
+        if len(self.levels) > 0:
+            with self.metrics.phase("pyramid"):
+                document['previews'] = preview.documents(
+                    self.db, document['checksum'], document['t'],
+                    document['psi'], self.levels)
+
+        with self.metrics.phase("encode"):
+            for key, value in document.items():
+                if isinstance(value, np.ndarray):
+                    document[key] = self.db.encode(value)
+                    self.metrics.count("bytes", snapshot.size(document[key]))
+
+        return document
+
+
+    def write(self, batch, j):
+        """ Inserts a batch of snapshots.
+
+        The observables and the previews carried by the snapshots are inserted
+        first. Once the whole batch is acknowledged, its latest snapshot is
+        recorded as the checkpoint of its run, with the same write concern.
+        Otherwise the writer fails, and its error is raised by the next call to
+        submit() or close().
+
+        @param self  the object pointer,
+        @param batch the encoded snapshots,
+        @param j     whether the write is acknowledged once journaled.
+        """
+        if self.error != None or len(batch) == 0:
+            return
+
+        samples = [sample for document in batch
+                   for sample in document.pop('observables', [])]
+        previews = [level for document in batch
+                    for level in document.pop('previews', [])]
+
+        try:
+            if len(samples) > 0:
+                with self.metrics.phase("observables_insert"):
+                    self.db.insert_observables(samples)
+
+            if len(previews) > 0:
+                with self.metrics.phase("previews_insert"):
+                    self.db.insert_previews(previews)
+
+            with self.metrics.phase("insert"):
+                written = len(self.db.insert_many(batch, self.w, j))
+
+            self.written += written
+            self.metrics.count("snapshots", written)
+
+            # The checkpoint must never move past a lost snapshot: the
+            # writer stops, and the run fails at its next submit().
+            if written < len(batch):
+                raise RuntimeError("Only %d of %d snapshots written"
+                                   % (written, len(batch)))
+
+            with self.metrics.phase("checkpoint"):
+                self.db.update_run(batch[-1]['checksum'],
+                                   {"checkpoint": batch[-1]['t']},
+                                   self.w, j)
+        except Exception as e:
+            self.error = e
+            logging.error("Snapshot writer failed: %s" % (str(e)))
+
+
+    def run(self):
+        """ Writer thread main function.
+
+        Waits for a snapshot, then takes all the snapshots already queued, up to
+        the batch size, and inserts them together except the latest one.
+
+        @param self the object pointer.
+        """
+        batch  = []
+        closed = False
+
+        while not closed:
+            document = self.queue.get()
+
+            while True:
+                if document is self.CLOSE:
+                    closed = True
+                    break
+
+                if self.error == None:
+                    try:
+                        batch.append(self.encode(document))
+                    except Exception as e:
+                        self.error = e
+                        logging.error("Snapshot writer failed: %s" % (str(e)))
+
+                if len(batch) > self.batch_size:
+                    break
+
+                try:
+                    document = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if closed:
+                self.write(batch, True)
+            else:
+                self.write(batch[:-1], self.j)
+                batch = batch[-1:]
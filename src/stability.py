@@ -0,0 +1,64 @@
+""" @package stability.py
+Provides the time step selection for the solver.
+
+The time step is derived from the spectral radius of the discrete Hamiltonian,
+the largest |E| / h_bar of the grid modes: the kinetic part is bounded by the
+5-point stencil, the potential part by the extrema of V0.
+"""
+import numpy as np
+
+from const import *
+
+
+def spectral_radius(grid, v0, h_bar = H_BAR, m = M):
+    """ Returns the spectral radius of the discrete Hamiltonian.
+
+    @param grid  the grid,
+    @param v0    the potential field,
+    @param h_bar the Planck constant,
+    @param m     the particle masse.
+
+    @return the largest |E| / h_bar of the grid modes.
+    """
+    kinetic = (2 * h_bar / m) * (1 / grid.dx ** 2 + 1 / grid.dy ** 2)
+    v_min, v_max = float(np.min(v0)), float(np.max(v0))
+
+    return max(abs(v_min) / h_bar, abs(v_max / h_bar + kinetic))
+
+
+def time_step(scheme, grid, v0, t_max, h_bar = H_BAR, m = M):
+    """ Returns the largest stable time step.
+
+    FTCS amplifies each mode by sqrt(1 + (dt E / h_bar)^2) per time step, so it
+    is never strictly stable: the time step is chosen so that the fastest mode
+    grows at most by a FTCS_GROWTH factor until \a t_max.
+
+    The other schemes are unconditionally stable. The BTCS, CTCS and ADI time
+    steps keep the phase of the fastest grid mode at 2 radians, about a third of
+    a turn, per step. The FFT scheme computes the kinetic phase exactly, so only the
+    potential phase is kept under half a turn per step.
+
+    @param scheme the scheme,
+    @param grid   the grid,
+    @param v0     the potential field,
+    @param t_max  the simulation time,
+    @param h_bar  the Planck constant,
+    @param m      the particle masse.
+
+    @return the time step.
+    """
+    rho = spectral_radius(grid, v0, h_bar, m)
+
+    if scheme == "ftcs":
+        return 2 * np.log(FTCS_GROWTH) / (max(t_max, 1 / rho) * rho ** 2)
+    elif scheme in ("btcs", "ctcs", "adi"):
+        return 2 / rho
+    elif scheme == "fft":
+        spread = float(np.max(v0)) - float(np.min(v0))
+
+        if spread > 0:
+            return np.pi * h_bar / spread
+
+        return 2 / rho
+
+    raise ValueError("Unknown scheme: %s" % (scheme))
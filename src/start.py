@@ -5,7 +5,9 @@ import json
 
 import logging
 
+import benchmark
 import monitor
+import sweep
 
 
 def usage():
@@ -75,18 +77,43 @@ def set_mongodb(mongodb, opts):
     return mongodb
 
 
+def set_solver(solver, opts):
+    """ Set the solver
+
+    @param solver the solver data,
+    @param opts   the options to set the solver.
+
+    @return the solver data set.
+    """
+    for opt, arg in opts:
+        if opt in ("-b", "--backend"):
+            solver['backend'] = arg
+        elif opt in ("-t", "--threads"):
+            solver['threads'] = int(arg)
+        elif opt in ("-P", "--processes"):
+            solver['processes'] = int(arg)
+
+    return solver
+
+
 def main():
     """ Main function.
     """
-    OPTLIST      = "hl:o:F:D:H:u:p:d:c:"
+    OPTLIST      = "hl:o:F:D:H:u:p:d:c:b:t:P:e:"
     LONG_OPTLIST = [
         "help", "settings=", "param=",
         "level=", "output=", "format=", "datefmt=",
         "host=", "username=", "password=", "dbname=", "collection=",
+        "backend=", "threads=", "processes=", "export=", "sweep=",
+        "benchmark=", "compare=",
     ]
 
     settings_file = "config/settings.json"
     param_file    = "config/param.json"
+    checksum      = None
+    sweep_file    = None
+    bench_file    = None
+    baseline_file = None
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], OPTLIST, LONG_OPTLIST)
@@ -103,6 +130,14 @@ def main():
             settings_file = arg
         elif opt == "--param":
             param_file = arg
+        elif opt in ("-e", "--export"):
+            checksum = arg
+        elif opt == "--sweep":
+            sweep_file = arg
+        elif opt == "--benchmark":
+            bench_file = arg
+        elif opt == "--compare":
+            baseline_file = arg
 
     with open(settings_file, "r") as read_file:
         settings = json.load(read_file)
@@ -110,8 +145,42 @@ def main():
     set_logger(settings['logger'], opts)
     logging.debug("Logging initialised")
 
+    solver = set_solver(settings.get('solver', {"backend": "native"}), opts)
+
+    if sweep_file != None:
+        settings['mongodb'] = set_mongodb(settings['mongodb'], opts)
+        settings['solver'] = solver
+        sweep.run(sweep_file, settings)
+        sys.exit()
+
+    if bench_file != None or baseline_file != None:
+        bench = settings.get('benchmark', {})
+        settings['mongodb'] = set_mongodb(settings['mongodb'], opts)
+
+        if bench_file != None:
+            benchmark.run(bench_file, settings)
+
+        if baseline_file != None:
+            regressions = benchmark.compare(bench.get('report', "benchmark.json"),
+                                            baseline_file,
+                                            bench.get('tolerance', 0.1))
+            sys.exit(1 if len(regressions) > 0 else 0)
+
+        sys.exit()
+
+    if checksum != None:
+        monitor.export(set_mongodb(settings['mongodb'], opts), checksum,
+                       settings['vtk']['output'], settings['vtk'],
+                       settings.get('storage', {}))
+        sys.exit()
+
     monitor.run(set_mongodb(settings['mongodb'], opts), param_file,
-                            settings['vtk']['output'])
+                settings['vtk']['output'], solver['backend'],
+                settings.get('writer', {}), settings['vtk'],
+                settings.get('storage', {}), threads = solver.get('threads', 0),
+                processes = solver.get('processes', 0),
+                metrics = settings.get('metrics', {}),
+                observables = settings.get('observables', {}))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+""" @package storage.py
+Provides the storage of the runs.
+
+A storage provides the methods of the MongoDBConnection class: use(), insert(),
+insert_many(), insert_run(), retrieve_run(), retrieve_runs(), update_run(),
+insert_observables(), retrieve_observables(), insert_previews(),
+retrieve_previews(), retrieve_checkpoint(), discard(), retrieve(),
+retrieve_all(), encode() and decode(). The MongoDB storage is the default one;
+the local storage writes the runs in a directory, without any server.
+"""
+import logging
+
+from mongoDBConnection import MongoDBConnection
+from localStorage import LocalStorage
+
+
+# Storage used when none is set.
+DEFAULT = "mongodb"
+
+
+def connect(mongodb, storage = {}):
+    """ Creates the storage of the runs.
+
+    The connect() function opens the storage set by \a storage, and switches to
+    the database and the collection of \a mongodb.
+
+    @param mongodb the MongoDB instance,
+    @param storage the storage settings.
+
+    @return the storage.
+    """
+    backend = storage.get('backend', DEFAULT)
+
+    if backend == "mongodb":
+        db = MongoDBConnection(mongodb['host'], mongodb['username'],
+                               mongodb['password'], mongodb['dbname'],
+                               mongodb.get('compression', "none"))
+    elif backend == "local":
+        db = LocalStorage(storage['path'])
+    else:
+        raise ValueError("Unknown storage: %s" % (backend))
+
+    db.use(mongodb['dbname'], mongodb['collection'])
+    logging.info("Using storage %s" % (backend))
+
+    return db
@@ -0,0 +1,191 @@
+""" @package sweep.py
+Provides a parameter sweep runner.
+
+A sweep spec is a JSON file holding the base parameters, or the path to a
+parameters file, and the values taken by some of them:
+
+    {
+        "base": "config/param.json",
+        "sweep": {
+            "args.0": [-5, 0, 5],
+            "field": ["youngs_slits", "barrier"]
+        }
+    }
+
+A key "name.i" sets the item i of the list parameter name. The sweep runs each
+case of the cartesian product of the values, without interaction, in a pool of
+processes. Each case has its own collection, named after the hash of its
+parameters, and its own output directory holding its parameters, its VTK files
+and its result, so the cases already done are skipped.
+"""
+import os
+import copy
+import itertools
+
+import json
+import csv
+
+import concurrent.futures
+
+import logging
+
+import time
+
+import fieldGenerator
+import monitor
+
+
+def expand(spec):
+    """ Expands a sweep spec.
+
+    @param spec the sweep spec.
+
+    @return the parameters of each case.
+    """
+    base = spec['base']
+
+    if isinstance(base, str):
+        with open(base, "r") as read_file:
+            base = json.load(read_file)
+
+    keys   = list(spec.get('sweep', {}).keys())
+    values = [spec['sweep'][key] for key in keys]
+    cases  = []
+
+    for combination in itertools.product(*values):
+        param = copy.deepcopy(base)
+
+        for key, value in zip(keys, combination):
+            name, _, item = key.partition(".")
+
+            if item != "":
+                param[name][int(item)] = value
+            else:
+                param[name] = value
+
+        cases.append(param)
+
+    return cases
+
+
+def init_worker(threads):
+    """ Initialises a worker process.
+
+    Limits the OpenMP threads of the native solver, so the cases running
+    together do not oversubscribe the cores, unless the number of solver
+    threads is set.
+
+    @param threads the number of threads by case.
+    """
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+
+
+def run_case(param, case, settings, output):
+    """ Runs a case of the sweep.
+
+    @param param    the parameters of the case,
+    @param case     the case name,
+    @param settings the settings,
+    @param output   the output directory of the case.
+
+    @return the result of the case.
+    """
+    os.makedirs(output + "/vti", exist_ok = True)
+
+    param_file = output + "/param.json"
+
+    with open(param_file, "w") as write_file:
+        json.dump(param, write_file, indent = 4)
+
+    mongodb = dict(settings['mongodb'])
+    mongodb['collection'] = "%s_%s" % (mongodb['collection'], case)
+
+    solver = settings.get('solver', {})
+
+    begin = time.time()
+
+    stats = monitor.run(mongodb, param_file, output + "/vti",
+                        solver.get('backend', "native"),
+                        settings.get('writer', {}), settings['vtk'],
+                        settings.get('storage', {}), interactive = False,
+                        threads = solver.get('threads', 0),
+                        processes = solver.get('processes', 1))
+
+    result = {"case": case, "checksum": stats['checksum'],
+              "wall": time.time() - begin, "compute": stats['time'],
+              "steps": stats['steps'], "norm": float(stats['norm'])}
+
+    with open(output + "/result.json", "w") as write_file:
+        json.dump(result, write_file, indent = 4)
+
+    return result
+
+
+def run(spec_file, settings):
+    """ Sweep main function.
+
+    The run() function runs the cases of \a spec_file which have no result
+    yet, then writes the summary of all the cases in summary.csv.
+
+    @param spec_file the path to the sweep spec,
+    @param settings  the settings.
+
+    @return the results of the cases.
+    """
+    with open(spec_file, "r") as read_file:
+        spec = json.load(read_file)
+
+    sweep   = settings.get('sweep', {})
+    output  = sweep.get('output', "sweep")
+    workers = sweep.get('workers', 0) or os.cpu_count() or 1
+    results = {}
+    pending = {}
+
+    cases = expand(spec)
+    workers = min(workers, len(cases)) or 1
+    logging.info("Sweep of %d cases, %d workers" % (len(cases), workers))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer = init_worker,
+            initargs = (max((os.cpu_count() or 1) // workers, 1),)) as pool:
+        for param in cases:
+            case = fieldGenerator.hash_content(
+                json.dumps(param, sort_keys = True).encode("utf-8"))
+            case_output = output + "/" + case
+
+            if os.path.exists(case_output + "/result.json"):
+                with open(case_output + "/result.json", "r") as read_file:
+                    results[case] = json.load(read_file)
+
+                logging.info("Case %s already done, skipped" % (case))
+                continue
+
+            future = pool.submit(run_case, param, case, settings, case_output)
+            pending[future] = case
+
+        for future in concurrent.futures.as_completed(pending):
+            case = pending[future]
+
+            try:
+                results[case] = future.result()
+                logging.info("Case %s done" % (case))
+            except Exception as e:
+                logging.error("Case %s failed: %s" % (case, str(e)))
+
+    os.makedirs(output, exist_ok = True)
+
+    with open(output + "/summary.csv", "w", newline = "") as write_file:
+        fields = ["case", "checksum", "wall", "compute", "steps", "norm"]
+        writer = csv.DictWriter(write_file, fields)
+        writer.writeheader()
+
+        for result in results.values():
+            writer.writerow(result)
+
+    print("%-32s %10s %10s %10s" % ("case", "wall (s)", "steps", "norm"))
+
+    for result in results.values():
+        print("%-32s %10.3f %10d %10.6f" % (result['case'], result['wall'],
+                                            result['steps'], result['norm']))
+
+    return results
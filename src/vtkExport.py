@@ -0,0 +1,149 @@
+""" @package vtkExport.py
+Provides the VTK export of a completed run.
+
+The snapshots of a run are streamed from the database without the potential
+field, which is read once from the run document, and their frames are written
+by a pool of processes. A frame file is named after the time step of its
+snapshot, so frames can be written in any order.
+
+The checksum of the exported run is recorded in the output directory. The
+frames already written by a previous export of the same run are skipped, while
+the frames of another run are overwritten.
+"""
+import os
+
+import concurrent.futures
+
+import logging
+
+import numpy as np
+
+import postProcessor
+import snapshot
+
+
+# File recording the run exported in an output directory.
+MARKER = ".checksum"
+
+""" The potential field of the run exported, set in each worker process. """
+_v0 = None
+
+
+def init_worker(v0):
+    """ Initialises a worker process.
+
+    @param v0 the potential field of the run.
+    """
+    global _v0
+    _v0 = v0
+
+
+def write_frame(document, file_name):
+    """ Writes a frame.
+
+    The frame is written in a temporary file, then renamed, so an interrupted
+    export never leaves a partial frame behind.
+
+    @param document  the encoded psi,
+    @param file_name the frame file name, without the extension.
+
+    @return the frame file name.
+    """
+    psi = snapshot.decode(document)
+
+    postProcessor.generate_vtk(_v0, np.real(psi), np.imag(psi),
+                               file_name + ".part")
+    os.replace(file_name + ".part.vti", file_name + ".vti")
+
+    return file_name
+
+
+def claim(output, checksum):
+    """ Records the run exported in an output directory.
+
+    @param output   the output directory,
+    @param checksum the run checksum.
+
+    @return true if the frames of \a output were already those of the run.
+    """
+    marker = os.path.join(output, MARKER)
+
+    os.makedirs(output, exist_ok = True)
+
+    if os.path.exists(marker):
+        with open(marker, "r") as read_file:
+            if read_file.read().strip() == checksum:
+                return True
+
+    with open(marker + ".part", "w") as write_file:
+        write_file.write(checksum + "\n")
+
+    os.replace(marker + ".part", marker)
+
+    return False
+
+
+def export(db, checksum, output, workers = None, in_flight = None):
+    """ Exports the snapshots of a run to VTK files.
+
+    The export() function streams the snapshots of the run \a checksum and
+    writes their frames in \a output with \a workers processes. At most
+    \a in_flight frames are pending at once, so the memory used does not grow
+    with the number of snapshots. The existing frames are only kept if
+    \a output already holds the frames of the run.
+
+    @see claim()
+
+    @param db        the database connection,
+    @param checksum  the run checksum,
+    @param output    the output directory,
+    @param workers   the number of processes [default: CPU count],
+    @param in_flight the maximum number of pending frames [default: 2 by process].
+
+    @return the number of frames written.
+    """
+    run = db.retrieve_run(checksum)
+
+    if run == None:
+        raise ValueError("Unknown run: %s" % (checksum))
+
+    workers   = workers or os.cpu_count() or 1
+    in_flight = in_flight or 2 * workers
+
+    resume = claim(output, checksum)
+
+    count   = 0
+    skipped = 0
+    pending = set()
+
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer = init_worker, initargs = (run['v0'],)) as pool:
+        for document in db.retrieve_all({"checksum": checksum},
+                                        {"t": 1, "psi": 1}):
+            file_name = postProcessor.frame_name(output, round(document['t'] / run['dt']))
+
+            if resume and os.path.exists(file_name + ".vti"):
+                skipped = skipped + 1
+                continue
+
+            psi = document['psi']
+
+            if 'gridfs' in psi:
+                psi['data'] = db.fs.get(psi.pop('gridfs')).read()
+
+            if len(pending) >= in_flight:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when = concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    future.result()
+
+            pending.add(pool.submit(write_frame, psi, file_name))
+            count = count + 1
+
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+
+    logging.info("%d frames written, %d already existing" % (count, skipped))
+
+    return count
@@ -1,28 +1,55 @@
 """ @package waves.py
 Provides wave functions for the solver.
+
+Wave functions are registered by name in WAVES. Each one takes its parameters,
+then the grid to compute psi on as keyword argument (the default grid from
+const.py if omitted).
 """
 import numpy as np
 
+import grid as grd
+
 from const import *
 
 
-def gaussian(x0, y0, w, A, kx, ky):
+# Wave functions available by their name in the configuration file.
+WAVES = {}
+
+
+def register(fun):
+    """ Registers a wave function.
+
+    @param fun the wave function.
+
+    @return the wave function.
+    """
+    WAVES[fun.__name__] = fun
+
+    return fun
+
+
+@register
+def gaussian(x0, y0, w, A, kx, ky, grid = None):
     """ Gaussian wave function.
 
-    @param x0 the initial x position,
-    @param y0 the initial y position,
-    @param w  the width of the gaussian,
-    @param A  the normalization constant,
-    @param kx the initial x speed,
-    @param ky the initial y speed.
+    The gaussian is separable, so it is computed as the product of a x column
+    and a y row.
+
+    @param x0   the initial x position,
+    @param y0   the initial y position,
+    @param w    the width of the gaussian,
+    @param A    the normalization constant,
+    @param kx   the initial x speed,
+    @param ky   the initial y speed,
+    @param grid the grid.
     """
-    X = np.linspace(X_MIN, X_MAX, N_X)
-    Y = np.linspace(Y_MIN, Y_MAX, N_Y)
+    if grid == None:
+        grid = grd.get()
 
-    psi = np.zeros((N_X, N_Y), dtype = complex, order = 'F')
+    X = np.exp(1j * kx * grid.X - ((grid.X - x0) ** 2) / (w ** 2))
+    Y = np.exp(1j * ky * grid.Y - ((grid.Y - y0) ** 2) / (w ** 2))
 
-    for x in range(len(X)):
-        for y in range(len(Y)):
-            psi[x, y] = A * np.exp(1j * (kx * X[x] + ky * Y[y])) * np.exp(-(((X[x] - x0) ** 2 + (Y[y] - y0) ** 2) / (w ** 2)))
+    psi = np.empty(grid.shape, dtype = complex, order = 'F')
+    np.multiply(A * X, Y, out = psi)
 
     return psi